@@ -0,0 +1,108 @@
+# benchmarks/bench_batching.py
+# Prueba de carga del micro-batching (src/batcher.py): N clientes concurrentes mandan
+# consultas de a una durante unos segundos, con distintos límites de tanda. Informa
+# consultas por segundo, latencia p50/p99 y tamaño medio de tanda. La fila con
+# --configs 1:0 es la línea de base: un retrieve_many por consulta.
+#
+#   python benchmarks/bench_batching.py
+#   python benchmarks/bench_batching.py --clients 1 16 64 --configs 1:0 16:2 32:5 64:10 --out batching.json
+#
+# Por defecto no usa el cache de embeddings ni el de consultas (cada consulta pasa por el
+# modelo, como una pregunta nueva); --cache los deja activos.
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+import chat_incremental as chat
+from batcher import MicroBatcher
+
+
+def sample_queries(meta, n, seed=0):
+    # Ventanas de 4 a 12 palabras de filas reales: casi todas distintas entre sí
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        words = meta[rng.randrange(len(meta))]["text"].split()
+        size = rng.randint(4, 12)
+        start = rng.randrange(max(1, len(words) - size))
+        out.append(" ".join(words[start:start + size]))
+    return out
+
+
+async def run_load(batcher, queries, clients, seconds, top_k, mode):
+    latencies = []
+    stop = time.perf_counter() + seconds
+
+    async def client(c):
+        i = c
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            await batcher.search(queries[i % len(queries)], top_k=top_k, mode=mode)
+            latencies.append(time.perf_counter() - t0)
+            i += clients
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    return np.asarray(latencies) * 1000, time.perf_counter() - t0
+
+
+async def measure(queries, max_batch, wait_ms, clients, seconds, top_k, mode):
+    def search_many(qs, k, sheets, m, collapse):
+        return chat.retrieve_many(qs, chat.get_snapshot(), top_k=k, sheet_filters=sheets, collapse=collapse, mode=m)
+
+    batcher = await MicroBatcher(search_many, max_batch, wait_ms).start()
+    try:
+        lat, elapsed = await run_load(batcher, queries, clients, seconds, top_k, mode)
+    finally:
+        await batcher.close()
+    return {"max_batch": max_batch, "wait_ms": wait_ms, "clients": clients, "queries": len(lat),
+            "qps": round(len(lat) / elapsed, 1), "p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "p99_ms": round(float(np.percentile(lat, 99)), 2), "mean_batch": batcher.stats()["mean_batch"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32, 64], help="clientes concurrentes")
+    parser.add_argument("--configs", nargs="+", default=["1:0", "8:2", "32:5", "64:10"],
+                        help="límites de tanda como max_batch:espera_ms")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duración de cada corrida")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", choices=chat.RETRIEVAL_MODES, default="dense",
+                        help="dense mide el encoder; hybrid/lexical resuelven algunas consultas sin él")
+    parser.add_argument("--cache", action="store_true", help="usar el cache de embeddings y el de consultas")
+    parser.add_argument("--out", help="guardar el resultado en JSON")
+    args = parser.parse_args()
+
+    chat.RETRIEVAL_SERVER = "off"
+    chat.USE_QUERY_CACHE = args.cache
+    if not args.cache:
+        chat.encode = lambda texts: chat.get_model().encode(list(texts), convert_to_numpy=True)
+    index, meta = chat.load_index_and_meta()
+    if index is None:
+        print("No hay índice; corré primero src/indexer.py")
+        sys.exit(1)
+    chat.get_model().encode(["calentamiento"], convert_to_numpy=True)
+    queries = sample_queries(meta, 20000)
+
+    results = []
+    print(f"{'tanda':>6} {'espera':>7} {'clientes':>9} {'consultas/s':>12} {'p50 (ms)':>9} {'p99 (ms)':>9} {'tanda media':>12}")
+    for config in args.configs:
+        max_batch, wait_ms = config.split(":")
+        for clients in args.clients:
+            r = asyncio.run(measure(queries, int(max_batch), float(wait_ms), clients, args.seconds, args.top_k,
+                                    args.mode))
+            results.append(r)
+            print(f"{r['max_batch']:>6} {r['wait_ms']:>6g}ms {clients:>9} {r['qps']:>12.1f} {r['p50_ms']:>9.2f} "
+                  f"{r['p99_ms']:>9.2f} {r['mean_batch']:>12.2f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "seconds": args.seconds, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.out}")
@@ -0,0 +1,83 @@
+# benchmarks/bench_build_documents.py
+# Compara el armado de documentos fila por fila (iterrows) contra el armado por columnas
+# de sources.build_documents_from_frames sobre hojas sintéticas de 10k, 100k y 1M filas.
+#
+#   python benchmarks/bench_build_documents.py
+#   python benchmarks/bench_build_documents.py --rows 10000 100000 --legacy-max 100000
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from sources import build_documents_from_frames
+
+
+def build_documents_legacy(sheets):
+    # Implementación original, se conserva como referencia
+    documents = []
+    for sheet_name, df in sheets.items():
+        df = df.fillna("")
+        for idx, row in df.iterrows():
+            parts = []
+            for col in df.columns:
+                val = str(row[col]).strip()
+                if val:
+                    parts.append(f"{col}: {val}")
+            text = "\n".join(parts).strip()
+            if not text:
+                continue
+            documents.append({"text": text, "metadata": {"sheet": sheet_name, "row_index": int(idx)}})
+    return documents
+
+
+def synthetic_sheet(n_rows, seed=0):
+    # Columnas con la mezcla típica de MATERIAS_UNIFICADAS: códigos, textos, números y celdas vacías
+    rng = np.random.default_rng(seed)
+    materias = np.array(["Matemática", "Lengua", "Historia", "Geografía", "Biología", "Física", "Química", "Inglés"])
+    nivel = np.array(["Primer año", "Segundo año", "Tercer año", "Cuarto año", "Quinto año"])
+    desc = np.array([
+        "Números racionales y operaciones",
+        "Comprensión lectora de textos expositivos",
+        "Revolución de Mayo y procesos de independencia",
+        "",
+        "Célula, tejidos y sistemas del cuerpo humano",
+    ])
+    horas = rng.integers(1, 7, n_rows).astype(float)
+    horas[rng.random(n_rows) < 0.1] = np.nan
+    return pd.DataFrame({
+        "Codigo": np.char.add("MAT", rng.integers(1, 10000, n_rows).astype(str)),
+        "Materia": materias[rng.integers(0, len(materias), n_rows)],
+        "Año": nivel[rng.integers(0, len(nivel), n_rows)],
+        "Unidad": rng.integers(1, 5, n_rows),
+        "Descripción": desc[rng.integers(0, len(desc), n_rows)],
+        "Horas semanales": horas,
+    })
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max", type=int, default=1_000_000,
+                        help="no correr la versión iterrows por encima de estas filas (tarda minutos)")
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'iterrows (s)':>14} {'columnar (s)':>14} {'speedup':>9}")
+    for n in args.rows:
+        sheets = {"MATERIAS_UNIFICADAS": synthetic_sheet(n)}
+        new_docs, t_new = timed(build_documents_from_frames, sheets)
+        if n <= args.legacy_max:
+            old_docs, t_old = timed(build_documents_legacy, sheets)
+            if old_docs != new_docs:
+                print(f"ATENCIÓN: los documentos difieren para {n} filas")
+            print(f"{n:>10} {t_old:>14.3f} {t_new:>14.3f} {t_old / t_new:>8.1f}x")
+        else:
+            print(f"{n:>10} {'-':>14} {t_new:>14.3f} {'-':>9}")
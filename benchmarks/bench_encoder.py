@@ -0,0 +1,86 @@
+# benchmarks/bench_encoder.py
+# Latencia de encode de una consulta (lo que hace retrieve) con cada backend de
+# src/encoders.py: p50/p99 en milisegundos y coseno mínimo contra torch.
+# Las consultas salen de los textos del índice (recortados) o de ejemplos fijos.
+#
+#   python src/encoders.py --export            # una vez, para tener los modelos ONNX
+#   python benchmarks/bench_encoder.py --queries 500 --out encoder.json
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+from encoders import BACKENDS, SAMPLE_TEXTS, MIN_COSINE, load_encoder
+
+
+def sample_queries(n, meta_path, seed=0):
+    # Primeras palabras de filas reales: largo parecido a una pregunta
+    texts = []
+    try:
+        import snapshots
+        from meta_store import open_meta
+        meta = open_meta(snapshots.resolve(meta_path))
+        if meta:
+            pick = np.random.default_rng(seed).choice(len(meta), size=min(n, len(meta)), replace=False)
+            texts = [" ".join(meta[int(i)]["text"].split()[:12]) for i in pick]
+    except (OSError, ValueError):
+        pass
+    while len(texts) < n:
+        texts.append(SAMPLE_TEXTS[len(texts) % len(SAMPLE_TEXTS)])
+    return texts
+
+
+def latencies(encoder, queries, warmup=10):
+    for q in queries[:warmup]:
+        encoder.encode([q], convert_to_numpy=True)
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        encoder.encode([q], convert_to_numpy=True)
+        out.append((time.perf_counter() - t0) * 1000)
+    return np.asarray(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--meta", default=os.path.join(ROOT, "index", "metadata.json"))
+    parser.add_argument("--out", help="guardar el resultado en JSON")
+    args = parser.parse_args()
+
+    queries = sample_queries(args.queries, args.meta)
+    reference = None
+    results = []
+    print(f"{'backend':>10} {'carga (s)':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'coseno mín':>11}")
+    for backend in args.backends:
+        t0 = time.perf_counter()
+        encoder = load_encoder(args.model, backend)
+        load_s = time.perf_counter() - t0
+        lat = latencies(encoder, queries)
+        check = queries[:100]
+        emb = np.asarray(encoder.encode(check, convert_to_numpy=True), dtype=np.float32)
+        if backend == "torch":
+            reference = emb
+        cos = None
+        if reference is not None:
+            a = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+            b = emb / np.linalg.norm(emb, axis=1, keepdims=True)
+            cos = float(np.einsum("ij,ij->i", a, b).min())
+        results.append({"backend": backend, "load_s": round(load_s, 3), "p50_ms": round(float(np.percentile(lat, 50)), 3),
+                        "p99_ms": round(float(np.percentile(lat, 99)), 3), "mean_ms": round(float(lat.mean()), 3),
+                        "cosine_min": cos})
+        cos_text = f"{cos:.4f}" if cos is not None else "-"
+        print(f"{backend:>10} {load_s:>10.2f} {results[-1]['p50_ms']:>9.2f} {results[-1]['p99_ms']:>9.2f} {cos_text:>11}")
+        if cos is not None and cos < MIN_COSINE:
+            print(f"  ATENCIÓN: {backend} se aparta de torch (coseno < {MIN_COSINE})")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "queries": len(queries), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.out}")
@@ -0,0 +1,242 @@
+# benchmarks/bench_indexer.py
+# Corre indexer.index_documents completo (dedup, chunks, manifiesto, cache de embeddings,
+# checkpoint, índice FAISS, shards, BM25, códigos y publicación de la versión) sobre libros
+# sintéticos con las mismas hojas que el nuestro y MATERIAS_UNIFICADAS escalada a
+# 10k/100k/1M filas, e informa el tiempo de cada etapa (indexer.StageTimer) y el pico de
+# memoria. Los embeddings los calcula un codificador de mentira (hash de palabras) para no
+# bajar modelos; los tiempos de esa etapa miden el pipeline, no al modelo real.
+#
+#   python benchmarks/bench_indexer.py --out bench_indexer.json
+#   python benchmarks/bench_indexer.py --rows 10000 100000 --stream --index-type sq8
+#
+# Cada tamaño corre en un proceso aparte para que el pico de memoria sea solo suyo.
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import platform
+import subprocess
+import tempfile
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+DIM = 384
+MAIN_SHEET = "MATERIAS_UNIFICADAS"
+
+# Hojas chicas del libro real: (filas, columnas)
+SMALL_SHEETS = {
+    "DICCIONARIO": (24, ["Nombre columna", "Hoja origen", "Descripción", "Tipo de dato", "Valores posibles / Ejemplo",
+                         "Reglas de llenado", "Edición restringida", "Validaciones", "Origen / Relación con otra hoja",
+                         "Observaciones"]),
+    "CONTENIDOS_PRODUCIDOS": (475, ["ContenidoID", "Titulo", "Descripcion", "Nombre_proveedor", "ProveedorID",
+                                    "URL_Contenido", "Bimestre_Aplicacion"]),
+    "ESPACIO_CURRICULAR_SA": (126, ["ID_Espacio_curricular", "Codigo_Espacio_curricular", "Modalidad", "Modalidad_Tipo",
+                                    "Año/Nivel", "Nombre_Espacio_curricular", "EsCompuesta", "Activo", "CategoriaPCI"]),
+    "TIPO_CONTENIDO": (16, ["TipoContenidoID", "Nombre", "Descripción", "Ícono", "Activo"]),
+    "ACTORES": (19, ["Rol ", "Area_Ministerio", "TipoArea", "Activo"]),
+    "TIPO_PROVEEDOR": (5, ["TipoProveedorID", "Nombre", "Descripcion", "Activo"]),
+    "PROVEEDORES": (3, ["ProveedorID", "Nombre_proveedor", "Contacto", "Email", "Especialidades", "Estado", "Activo"]),
+    "MODALIDADES": (3, ["ModalidadID", "Nombre", "Descripcion", "Años_Duracion", "Sistema_Evaluacion", "Activo"]),
+    "ESPECIALIDADES": (43, ["EspecialidadID", "ModalidadID", "Nombre", "Codigo", "Area", "Tipo", "Activo"]),
+    "AÑOS_ACADEMICOS": (6, ["AnioID", "Numero", "Nombre", "Ciclo", "Descripcion", "Activo"]),
+    "PERIODOS_ACADEMICOS": (2, ["PeriodoID", "Nombre", "Tipo", "Duracion_Semanas", "Cantidad_Anual", "Descripcion"]),
+    "Contenidos_SA_mapeados_GOICE": (475, ["Contenido_ID", "ÁREAS", "ESPACIO CURRICULAR", "Nivel", "Bimestre",
+                                           "Tipo de cursada", "TÍTULO DEL PLAN", "Nivel_num", "MateriasSA"]),
+    "MateriaContenido": (1, ["MateriaID", "NombreMateria", "ContenidoID", "TituloPlan/NombreContenido", "Nivel"]),
+    "Contenidos_priorizados": (2, ["ContenidoPriorizadoID", "NombreContenidoPriorizado", "MateriaID", "Enlaces"]),
+    "CONTENIDOS_Proveedor": (31, ["ID_Contenido_producido", "Nombre_Contenido", "Materia_hoja", "Es_Troncal",
+                                  "Es_Prioritario", "Eje_Tematico", "Activo"]),
+}
+
+MAIN_COLUMNS = ["IDMateria", "CodigoMateria", "Modalidad", "Modalidad_Tipo", "EspecialidadID", "Año/Nivel",
+                "NombreMateria", "EsCompuesta", "Activo", "CategoriaFormacion", "HorasCatedra", "Observaciones"]
+
+WORDS = ("contenido materia lengua matemática historia geografía biología física química inglés taller práctica "
+         "proyecto lectura escritura números funciones célula energía ciudadanía arte música tecnología ciclo "
+         "básico orientado técnica bachiller nivel primer segundo tercer cuarto quinto bimestre evaluación").split()
+MODALIDADES = ["Bachiller", "Técnica", "Artística", "Adultos"]
+NIVELES = ["1° año", "2° año", "3° año", "4° año", "5° año", "6° año"]
+
+
+def _phrase(rng, low, high):
+    return " ".join(rng.choice(WORDS, size=rng.integers(low, high)))
+
+
+def generic_row(rng, columns, i):
+    # Mezcla de ids, números, textos cortos, textos largos y celdas vacías
+    row = []
+    for j, col in enumerate(columns):
+        if j == 0:
+            row.append(i + 1)
+        elif rng.random() < 0.08:
+            row.append(None)
+        elif col.startswith(("Activo", "Es")):
+            row.append(rng.choice(["Sí", "No"]))
+        elif "Descrip" in col or "Observ" in col or "Reglas" in col:
+            row.append(_phrase(rng, 8, 60).capitalize() + ".")
+        elif col.endswith("ID") or "Numero" in col or "Cantidad" in col:
+            row.append(int(rng.integers(1, 500)))
+        else:
+            row.append(_phrase(rng, 1, 5).capitalize())
+    return row
+
+
+def main_row(rng, i):
+    return [
+        i + 1,
+        f"MAT{i + 1:06d}",
+        rng.choice(MODALIDADES),
+        rng.choice(["Común", "Especial"]),
+        int(rng.integers(1, 44)),
+        rng.choice(NIVELES),
+        _phrase(rng, 1, 4).capitalize(),
+        rng.choice(["Sí", "No"]),
+        "Sí",
+        rng.choice(["General", "Científico-tecnológica", "Técnica específica", "Práctica profesionalizante"]),
+        float(rng.integers(2, 8)) if rng.random() > 0.1 else None,
+        _phrase(rng, 5, 40).capitalize() if rng.random() < 0.3 else None,
+    ]
+
+
+def generate_workbook(path, main_rows, seed=0):
+    from openpyxl import Workbook
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    for sheet, (n, columns) in SMALL_SHEETS.items():
+        ws = wb.create_sheet(sheet)
+        ws.append(columns)
+        for i in range(n):
+            ws.append(generic_row(rng, columns, i))
+    ws = wb.create_sheet(MAIN_SHEET)
+    ws.append(MAIN_COLUMNS)
+    for i in range(main_rows):
+        ws.append(main_row(rng, i))
+    wb.save(path)
+
+
+class HashEncoder:
+    # Reemplazo determinístico de SentenceTransformer: cada palabra suma en una dimensión
+    # elegida por crc32 y el vector se normaliza. Misma interfaz que usa embed_pipeline.
+    def __init__(self, dim=DIM):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=64, show_progress_bar=False, convert_to_numpy=True):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                h = zlib.crc32(word.encode("utf-8"))
+                out[i, h % self.dim] += 1.0 if h & 1 << 31 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows: psutil si está instalado
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB, macOS bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def run_single(xlsx, workdir, stream, index_type, batch_size):
+    import indexer
+    import snapshots
+    import faiss_index
+    from sources import build_documents_from_excel, iter_documents_from_excel
+
+    # El indexer real, con el codificador de mentira en lugar del modelo
+    indexer.load_encoder = lambda model_name, backend="torch": HashEncoder()
+    timer = indexer.StageTimer()
+    t0 = time.perf_counter()
+    if stream:
+        # La lectura corre adentro de index_documents, a medida que se consumen las filas
+        docs = iter_documents_from_excel(xlsx)
+    else:
+        with timer.stage("extraction"):
+            docs = build_documents_from_excel(xlsx)
+    index_path = os.path.join(workdir, "faiss.index")
+    indexer.index_documents(docs, index_path=index_path, meta_path=os.path.join(workdir, "metadata.json"),
+                            incremental=False, index_type=index_type, batch_size=batch_size, workers=1, timer=timer)
+    total = time.perf_counter() - t0
+
+    info = snapshots.read_manifest(snapshots.current_dir(workdir))
+    params = faiss_index.read_params(snapshots.resolve(index_path))
+    rss = peak_rss_mb()
+    return {"documents": info["documents"], "vectors": info["vectors"], "index": faiss_index.describe(params),
+            "phases": {k: round(v, 4) for k, v in timer.seconds.items()},
+            "total": round(total, 4), "peak_rss_mb": rss and round(rss, 1)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help=f"filas de {MAIN_SHEET} en cada libro sintético")
+    parser.add_argument("--out", default="bench_indexer.json", help="archivo JSON con los resultados")
+    parser.add_argument("--workdir", help="carpeta para los libros generados (se reusan entre corridas)")
+    parser.add_argument("--stream", action="store_true", help="extraer con openpyxl read_only (indexer --stream)")
+    parser.add_argument("--index-type", default="auto", help="tipo de índice FAISS (como indexer --index-type)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Proceso hijo: mide un libro e imprime el resultado como JSON en la última línea
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run_single(args.single, tmp, args.stream, args.index_type, args.batch_size)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "bench_indexer")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    print(f"{'filas':>10} {'docs':>9} {'extracción':>11} {'dedup':>8} {'embeddings':>11} {'índice':>9} {'shards':>8} "
+          f"{'bm25':>8} {'total':>9} {'RSS MB':>8}")
+    for n in args.rows:
+        xlsx = os.path.join(workdir, f"sintetico_{n}_{args.seed}.xlsx")
+        if not os.path.exists(xlsx):
+            t0 = time.perf_counter()
+            generate_workbook(xlsx, n, seed=args.seed)
+            print(f"  (libro de {n} filas generado en {time.perf_counter() - t0:.1f}s)")
+        cmd = [sys.executable, os.path.abspath(__file__), "--single", xlsx, "--index-type", args.index_type,
+               "--batch-size", str(args.batch_size)] + (["--stream"] if args.stream else [])
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stdout + proc.stderr)
+            sys.exit(proc.returncode)
+        result = {"rows": n, **json.loads(proc.stdout.strip().splitlines()[-1])}
+        results.append(result)
+        p = result["phases"]
+        rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+        print(f"{n:>10} {result['documents']:>9} {p.get('extraction', 0):>10.2f}s {p.get('dedup', 0):>7.2f}s "
+              f"{p.get('embedding', 0):>10.2f}s {p.get('index_build', 0):>8.2f}s {p.get('shards', 0):>7.2f}s "
+              f"{p.get('lexical', 0):>7.2f}s {result['total']:>8.2f}s {rss:>8}")
+
+    report = {"commit": git_commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "platform": platform.platform(), "encoder": f"HashEncoder (dim {DIM})", "stream": args.stream,
+              "index_type": args.index_type, "results": results}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados en {args.out}")
@@ -0,0 +1,105 @@
+# benchmarks/bench_mmap.py
+# Memoria de N procesos que cargan el mismo índice (workers de Streamlit, chats, el servicio
+# de búsqueda), con el índice copiado al heap de cada uno o abierto con mmap (FAISS_MMAP=1).
+# Cada worker carga la versión actual y hace búsquedas al azar para tocar todo el índice;
+# con todos vivos se lee /proc/<pid>/smaps_rollup. RSS cuenta entera cada página compartida
+# en cada proceso; PSS la reparte entre los que la usan, así que la suma de PSS es la memoria
+# que de verdad ocupan los N. Solo Linux.
+#
+#   python benchmarks/bench_mmap.py
+#   python benchmarks/bench_mmap.py --workers 1 4 8 --searches 200 --out mmap.json
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+SRC = os.path.join(ROOT, "src")
+FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+
+def worker(searches):
+    sys.path.insert(0, SRC)
+    import numpy as np
+    import chat_incremental as chat
+    chat.RETRIEVAL_SERVER = "off"
+    t0 = time.perf_counter()
+    index, meta = chat.load_index_and_meta()
+    load_s = time.perf_counter() - t0
+    rng = np.random.default_rng(os.getpid())
+    t0 = time.perf_counter()
+    for _ in range(searches):
+        index.search(rng.standard_normal((1, index.d)).astype(np.float32), 5)
+    search_ms = (time.perf_counter() - t0) * 1000 / max(1, searches)
+    print(json.dumps({"type": type(index).__name__, "ntotal": int(index.ntotal), "load_s": round(load_s, 3),
+                      "search_ms": round(search_ms, 3)}), flush=True)
+    # Sigue vivo hasta que el padre termine de medir
+    sys.stdin.read()
+
+
+def smaps(pid):
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in FIELDS:
+                out[name] = int(value.split()[0]) / 1024
+    return out
+
+
+def measure(workers, mmap, searches):
+    env = dict(os.environ, FAISS_MMAP="1" if mmap else "0")
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", "--searches", str(searches)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env)
+             for _ in range(workers)]
+    try:
+        info = [json.loads(p.stdout.readline()) for p in procs]
+        mem = [smaps(p.pid) for p in procs]
+    finally:
+        for p in procs:
+            p.communicate("")
+    total = {name: round(sum(m.get(name, 0) for m in mem), 1) for name in FIELDS}
+    return {"workers": workers, "mmap": mmap, "index_type": info[0]["type"], "ntotal": info[0]["ntotal"],
+            "load_s": round(max(i["load_s"] for i in info), 3),
+            "search_ms": round(sum(i["search_ms"] for i in info) / len(info), 3),
+            "rss_mb": total["Rss"], "pss_mb": total["Pss"],
+            "shared_mb": round(total["Shared_Clean"] + total["Shared_Dirty"], 1),
+            "private_mb": round(total["Private_Clean"] + total["Private_Dirty"], 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="procesos simultáneos")
+    parser.add_argument("--searches", type=int, default=100, help="búsquedas al azar por worker")
+    parser.add_argument("--out", help="guardar el resultado en JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.searches)
+        sys.exit(0)
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("Hace falta /proc/<pid>/smaps_rollup (Linux)")
+        sys.exit(1)
+
+    results = []
+    print(f"{'workers':>8} {'modo':>6} {'índice':>16} {'carga (s)':>10} {'búsq. (ms)':>11} "
+          f"{'RSS (MB)':>9} {'PSS (MB)':>9} {'compart.':>9} {'privada':>9}")
+    for workers in args.workers:
+        for mmap in (False, True):
+            try:
+                r = measure(workers, mmap, args.searches)
+            except (ValueError, OSError) as e:
+                print(f"El worker no arrancó ({e}); ¿hay índice? corré primero src/indexer.py")
+                sys.exit(1)
+            results.append(r)
+            print(f"{workers:>8} {'mmap' if mmap else 'copia':>6} {r['index_type']:>16} {r['load_s']:>10.3f} "
+                  f"{r['search_ms']:>11.3f} {r['rss_mb']:>9.1f} {r['pss_mb']:>9.1f} {r['shared_mb']:>9.1f} "
+                  f"{r['private_mb']:>9.1f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"searches": args.searches, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.out}")
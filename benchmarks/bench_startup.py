@@ -0,0 +1,89 @@
+# benchmarks/bench_startup.py
+# Tiempo de arranque del chat: reporte de `python -X importtime` al importar el módulo y
+# tiempo de `chat_incremental.py --help`. Falla (código 1) si al importar se cargan
+# módulos pesados que tendrían que esperar al primer uso, o si se pasa del presupuesto.
+#
+#   python benchmarks/bench_startup.py
+#   python benchmarks/bench_startup.py --max-ms 300 --out startup.json
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+SRC = os.path.join(ROOT, "src")
+
+# Se importan recién con la primera pregunta o en el hilo de precarga
+HEAVY_MODULES = ["sentence_transformers", "torch", "transformers", "faiss", "numpy", "pandas", "openai"]
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    return env
+
+
+def import_report(module):
+    # Cada línea de -X importtime: "import time: self [us] | cumulative | nombre"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                          env=_env(), capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{proc.stderr[-2000:]}")
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append({"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return entries
+
+
+def time_help(script, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, script, "--help"], cwd=ROOT, env=_env(), capture_output=True, check=True)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="chat_incremental")
+    parser.add_argument("--runs", type=int, default=5, help="corridas de --help (se informa la mediana)")
+    parser.add_argument("--top", type=int, default=15, help="módulos más lentos a mostrar")
+    parser.add_argument("--max-ms", type=float, default=500, help="presupuesto para importar el módulo")
+    parser.add_argument("--out", help="guardar el resultado en JSON")
+    args = parser.parse_args()
+
+    entries = import_report(args.module)
+    top_level = next(e for e in reversed(entries) if e["module"] == args.module)
+    total_ms = top_level["cumulative_us"] / 1000
+    print(f"import {args.module}: {total_ms:.0f} ms en total, {len(entries)} módulos")
+    print(f"{'acumulado (ms)':>15} {'propio (ms)':>12}  módulo")
+    for e in sorted(entries, key=lambda e: e["cumulative_us"], reverse=True)[:args.top]:
+        print(f"{e['cumulative_us'] / 1000:>15.1f} {e['self_us'] / 1000:>12.1f}  {e['module']}")
+
+    help_s = time_help(os.path.join(SRC, f"{args.module}.py"), args.runs)
+    print(f"\n{args.module}.py --help: {help_s * 1000:.0f} ms (mediana de {args.runs})")
+
+    loaded = {e["module"].split(".")[0] for e in entries}
+    heavy = [m for m in HEAVY_MODULES if m in loaded]
+    problems = []
+    if heavy:
+        problems.append(f"módulos pesados importados al arrancar: {', '.join(heavy)}")
+    if total_ms > args.max_ms:
+        problems.append(f"el import tarda {total_ms:.0f} ms (presupuesto {args.max_ms:.0f} ms)")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"module": args.module, "import_ms": round(total_ms, 1), "help_ms": round(help_s * 1000, 1),
+                       "heavy_modules": heavy, "modules": entries}, f, ensure_ascii=False, indent=2)
+    if problems:
+        for p in problems:
+            print("FALLA:", p)
+        sys.exit(1)
+    print("OK: arranque sin módulos pesados y dentro del presupuesto")
@@ -0,0 +1,123 @@
+# src/batcher.py
+# Micro-batching de consultas concurrentes: las que llegan dentro de una ventana corta
+# (MAX_WAIT_MS o MAX_BATCH consultas, lo que pase primero) se resuelven con un solo
+# retrieve_many (un encode y una búsqueda matricial) y cada una recibe su resultado.
+# Con varios profesores a la vez rinde mucho más que un encode por consulta.
+#
+# Desde código asyncio:       results = await batcher.search("CONT12", top_k=4)
+# Desde hilos (el servidor):  BatcherThread(batcher).search("CONT12", top_k=4)
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_BATCH = int(os.getenv("BATCH_MAX_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    def __init__(self, search_many, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        # search_many(queries, top_k, sheet_filters, mode, collapse) -> una lista de resultados por consulta
+        self.search_many = search_many
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        # Un solo hilo para las búsquedas: mientras corre una tanda se junta la siguiente
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+        self._queue = None
+        self._arrived = None
+        self._task = None
+        self.batches = 0
+        self.queries = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._arrived = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            while not self._queue.empty():
+                self._queue.get_nowait()[-1].cancel()
+        self._executor.shutdown(wait=True)
+
+    async def search(self, query, top_k=4, sheet_filter=None, mode=None, collapse="max"):
+        if self._task is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((query, top_k, sheet_filter, mode, collapse, future))
+        self._arrived.set()
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while True:
+            # Lo que ya está en la cola entra sin esperar; después, hasta el fin de la ventana
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - loop.time()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                return batch
+            # Se espera un aviso y no queue.get(): cancelar la espera no puede perder una consulta
+            self._arrived.clear()
+            if self._queue.empty():
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # top_k, modo y collapse cambian el ranking: van en llamadas separadas
+            groups = {}
+            for item in batch:
+                groups.setdefault((item[1], item[3], item[4]), []).append(item)
+            for (top_k, mode, collapse), items in groups.items():
+                items = [it for it in items if not it[5].cancelled()]
+                if not items:
+                    continue
+                try:
+                    results = await loop.run_in_executor(self._executor, self.search_many, [it[0] for it in items],
+                                                         top_k, [it[2] for it in items], mode, collapse)
+                except Exception as e:
+                    for it in items:
+                        if not it[5].done():
+                            it[5].set_exception(e)
+                    continue
+                self.batches += 1
+                self.queries += len(items)
+                for it, result in zip(items, results):
+                    if not it[5].done():
+                        it[5].set_result(result)
+
+    def stats(self):
+        return {"batches": self.batches, "queries": self.queries,
+                "mean_batch": round(self.queries / self.batches, 2) if self.batches else 0.0}
+
+
+class BatcherThread:
+    # Corre el batcher en un event loop propio para usarlo desde código con hilos
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="batcher-loop", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(batcher.start(), self.loop).result()
+
+    def search(self, query, top_k=4, sheet_filter=None, mode=None, collapse="max", timeout=None):
+        return asyncio.run_coroutine_threadsafe(self.batcher.search(query, top_k, sheet_filter, mode, collapse),
+                                                self.loop).result(timeout)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.batcher.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
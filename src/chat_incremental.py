@@ -1,13 +1,16 @@
 # src/chat_incremental.py
+# sentence_transformers (torch), faiss y numpy se importan recién cuando hacen falta:
+# --help, log y cache arrancan al instante y el modelo se precarga en un hilo aparte.
 import os
-import json
+import time
 import argparse
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
+import threading
+from collections import namedtuple
 from dotenv import load_dotenv
 import datetime
 import csv
+from snapshots import SnapshotWatcher, SnapshotWriter, current_version, SNAPSHOT_DIR
+from retrieval_client import DEFAULT_ADDRESS, RetrievalServerError, find_server
 
 load_dotenv()
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
@@ -16,66 +19,399 @@ OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 INDEX_PATH = "index/faiss.index"
 META_PATH = "index/metadata.json"
 LOG_PATH = "index/query_log.csv"
+INDEX_DIR = os.path.dirname(INDEX_PATH)
 
 MODEL_NAME = "all-MiniLM-L6-v2"
+# torch, onnx u onnx-int8 (src/encoders.py); el índice tiene que haberse armado con el mismo modelo
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
 
-# Cargar modelo (una vez)
-MODEL = SentenceTransformer(MODEL_NAME)
+# Modelo: se carga una vez, en el primer encode o en el hilo de precarga (warm_up)
+MODEL = None
+_MODEL_LOCK = threading.Lock()
+_LOAD_LOCK = threading.Lock()
+
+# Todo lo de una versión del índice, cargado junto. Cada búsqueda usa un solo Snapshot de
+# principio a fin: si el indexer publica otra versión en el medio, no se mezclan.
+#   index, meta     índice FAISS y metadatos (meta_store)
+#   shards          router de shards por hoja, si el indexer los generó
+#   duplicates      filas colapsadas en un documento: id -> [metadata de cada una (+ "text" si difería)]
+#   parents         id de FAISS -> documento padre, si el indexer partió filas largas en chunks
+#   rescore         (vectores float32, factor) para reordenar los candidatos de un índice fp16/sq8
+#   sheet_filter    ids de cada hoja para buscar con filtro sin shards (sheet_filter.SheetFilter)
+#   lexical         índice BM25 (lexical.LexicalIndex), si el indexer lo generó
+#   codes           código (CONT12, PROV2...) -> filas donde aparece (codes.CodeIndex)
+Snapshot = namedtuple("Snapshot", ["version", "index", "meta", "shards", "duplicates", "parents", "rescore",
+                                   "sheet_filter", "lexical", "codes"])
+
+# dense (solo vectores), lexical (solo BM25) o hybrid: ambos fusionados con RRF, y solo BM25
+# (sin pasar por el modelo) cuando la consulta es un código como CONT12
+RETRIEVAL_MODES = ["dense", "hybrid", "lexical"]
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# En hybrid cada ranking aporta top_k * HYBRID_DEPTH candidatos a la fusión
+HYBRID_DEPTH = 4
+# Cómo se juntan los chunks de una fila larga (chunking.collapse_hits)
+COLLAPSE_MODES = ["max", "sum"]
+
+# Servicio de búsqueda (src/retrieval_server.py): si está corriendo, las búsquedas van ahí y
+# este proceso no carga modelo ni índice. "off" lo desactiva.
+RETRIEVAL_SERVER = DEFAULT_ADDRESS
+# Segundos entre intentos de encontrar el servicio cuando no está
+SERVER_RECHECK = 30.0
+_CLIENT = None
+_CLIENT_CHECKED = None
+
+# Cache semántico de resultados y respuestas (src/query_cache.py); QUERY_CACHE=off lo desactiva
+USE_QUERY_CACHE = os.getenv("QUERY_CACHE", "on") != "off"
+QUERY_CACHE = None
+
+def get_model():
+    global MODEL
+    if MODEL is None:
+        with _MODEL_LOCK:
+            if MODEL is None:
+                from encoders import load_encoder
+                MODEL = load_encoder(MODEL_NAME, ENCODER_BACKEND)
+    return MODEL
+
+def get_client():
+    global _CLIENT, _CLIENT_CHECKED
+    if RETRIEVAL_SERVER == "off":
+        return None
+    if _CLIENT is None and (_CLIENT_CHECKED is None or time.monotonic() - _CLIENT_CHECKED > SERVER_RECHECK):
+        _CLIENT_CHECKED = time.monotonic()
+        _CLIENT = find_server(RETRIEVAL_SERVER)
+    return _CLIENT
+
+def get_query_cache(version=None):
+    # Se vacía solo cuando cambia la versión del índice
+    global QUERY_CACHE
+    if not USE_QUERY_CACHE:
+        return None
+    if QUERY_CACHE is None:
+        from query_cache import SemanticCache
+        QUERY_CACHE = SemanticCache()
+    QUERY_CACHE.check_version(version or index_version())
+    return QUERY_CACHE
+
+def index_version():
+    # Con el servicio de búsqueda levantado las búsquedas usan su versión, no la de este proceso
+    global _CLIENT
+    client = get_client()
+    if client is not None:
+        try:
+            return client.health()["version"]
+        except RetrievalServerError as e:
+            print(f"(El servicio de búsqueda falló, se busca en este proceso: {e})")
+            _CLIENT = None
+    return SNAPSHOT.version
+
+def snapshot_for_search():
+    # Con el servicio de búsqueda levantado no hace falta cargar nada en este proceso
+    return None if get_client() is not None else get_snapshot()
+
+def warm_up():
+    # Carga modelo e índice mientras el usuario escribe la primera pregunta
+    def run():
+        if get_client() is not None:
+            return
+        try:
+            get_model().encode(["calentamiento"], convert_to_numpy=True)
+            get_snapshot()
+        except Exception as e:
+            print(f"\n(No se pudo precargar el modelo: {e})")
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
 
 def ensure_index_files():
+    from meta_store import write_store, store_exists, migrate_json
     if not os.path.exists("index"):
         os.makedirs("index", exist_ok=True)
-    if not os.path.exists(META_PATH):
-        with open(META_PATH, "w", encoding="utf-8") as f:
-            json.dump([], f)
+    if current_version(INDEX_DIR) is None and not store_exists(META_PATH):
+        if os.path.exists(META_PATH):
+            # metadata.json de versiones anteriores: se convierte una sola vez
+            count = migrate_json(META_PATH)
+            print(f"Metadatos migrados al formato binario ({count} registros)")
+        else:
+            write_store([], META_PATH)
 
-def load_index_and_meta():
-    ensure_index_files()
-    if os.path.exists(INDEX_PATH):
-        index = faiss.read_index(INDEX_PATH)
+def load_snapshot(snapshot_dir):
+    # Todo lo de una misma versión del índice (index/snapshots/vNNNNNN o index/ sin versiones)
+    import numpy as np
+    import faiss_index
+    import shards
+    from dedup import load_duplicates
+    from chunking import load_parents
+    from meta_store import open_meta
+    from lexical import LexicalIndex, has_lexical
+    from codes import CodeIndex
+    index_path = os.path.join(snapshot_dir, os.path.basename(INDEX_PATH))
+    if os.path.exists(index_path):
+        # flat, ivf, hnsw o ivfpq según lo que haya escrito el indexer (nprobe/efSearch por env)
+        index, params = faiss_index.load_index(index_path)
     else:
         # índice vacío (dim se definirá al primer add)
-        index = None
-    with open(META_PATH, "r", encoding="utf-8") as f:
-        meta = json.load(f)
-    return index, meta
+        index, params = None, {}
+    # Solo se mapea el archivo; cada meta[i] decodifica una fila
+    meta = open_meta(os.path.join(snapshot_dir, os.path.basename(META_PATH)))
+    router = shards.ShardRouter(index_path) if index is not None and shards.has_shards(index_path) else None
+    rescore = faiss_index.load_rescore_vectors(index_path, params) if index is not None else None
+    duplicates, parents = load_duplicates(index_path), load_parents(index_path)
+    sheet_ids = None
+    if index is not None and meta is not None:
+        from sheet_filter import SheetFilter
+        vectors = faiss_index.vectors_path(index_path)
+        sheet_ids = SheetFilter(meta, duplicates, parents,
+                                np.load(vectors, mmap_mode="r") if os.path.exists(vectors) else None)
+    lexicon = LexicalIndex(index_path) if index is not None and has_lexical(index_path) else None
+    codes = CodeIndex.load(index_path) if index is not None else None
+    in_snapshots = os.path.basename(os.path.dirname(os.path.normpath(snapshot_dir))) == SNAPSHOT_DIR
+    version = os.path.basename(os.path.normpath(snapshot_dir)) if in_snapshots else None
+    return Snapshot(version, index, meta, router, duplicates, parents, rescore, sheet_ids, lexicon, codes)
+
+# Si el indexer publica una versión nueva, se carga en segundo plano y se cambia sin reiniciar
+SNAPSHOT = SnapshotWatcher(INDEX_DIR, load_snapshot)
+
+def get_snapshot():
+    if SNAPSHOT.value is None:
+        # La primera carga puede venir a la vez del hilo de precarga y de una pregunta
+        with _LOAD_LOCK:
+            if SNAPSHOT.value is None:
+                ensure_index_files()
+                SNAPSHOT.refresh()
+    return SNAPSHOT.get()
 
-def save_index(index):
-    faiss.write_index(index, INDEX_PATH)
+def load_index_and_meta():
+    snapshot = get_snapshot()
+    return snapshot.index, snapshot.meta
+
+def save_index(index, path=INDEX_PATH):
+    import faiss_index
+    faiss_index.write_index(index, path)
 
 def save_meta(meta):
-    with open(META_PATH, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    meta.flush()
+
+def encode(texts):
+    # Los textos y consultas repetidos salen del cache en disco en vez del modelo
+    from embedding_cache import get_cache
+    from encoders import encoder_id
+    return get_cache().encode(encoder_id(MODEL_NAME, ENCODER_BACKEND), texts,
+                              lambda batch: get_model().encode(batch, convert_to_numpy=True))
 
-def add_document_to_index(text, metadata, index, meta):
-    emb = MODEL.encode([text], convert_to_numpy=True)
+def add_document_to_index(text, metadata, snapshot=None):
+    # Devuelve el Snapshot de la versión nueva
+    import faiss
+    import faiss_index
+    import shards
+    from meta_store import write_store, store_exists, MetaStore
+    from codes import CodeIndex
+    snapshot = snapshot or get_snapshot()
+    index, meta = snapshot.index, snapshot.meta
+    # La versión nueva sale de la misma que se cargó, no de la que apunte CURRENT ahora
+    source = os.path.join(INDEX_DIR, SNAPSHOT_DIR, snapshot.version) if snapshot.version else INDEX_DIR
+    emb = encode([text])
     if index is None:
         dim = emb.shape[1]
         index = faiss.IndexFlatL2(dim)
+    else:
+        # Se agrega sobre una copia: el Snapshot cargado no cambia mientras otras búsquedas lo usan
+        # (y con FAISS_MMAP es de solo lectura)
+        index, _ = faiss_index.load_index(os.path.join(source, os.path.basename(INDEX_PATH)), mmap=False)
     index.add(emb)
-    meta.append({"metadata": metadata, "text": text})
-    save_index(index)
-    save_meta(meta)
-    return index, meta
+    # Versión nueva copiada de la actual: los otros procesos la toman recién en el commit
+    # (el metadata.json viejo no se copia: ya está migrado al formato binario)
+    writer = SnapshotWriter(INDEX_DIR, copy_from=source, skip={os.path.basename(META_PATH)})
+    try:
+        save_index(index, writer.path(os.path.basename(INDEX_PATH)))
+        meta_path = writer.path(os.path.basename(META_PATH))
+        if not store_exists(meta_path):
+            write_store(list(meta or []), meta_path)
+        new_meta = MetaStore(meta_path)
+        new_meta.append({"metadata": metadata, "text": text})
+        save_meta(new_meta)
+        if snapshot.codes is not None:
+            CodeIndex(dict(snapshot.codes.entries)).add(len(new_meta) - 1, text).save(writer.path(os.path.basename(INDEX_PATH)))
+        if snapshot.shards is not None:
+            shards.ShardRouter(writer.path(os.path.basename(INDEX_PATH))).add(metadata.get("sheet", ""), emb, len(new_meta) - 1)
+        new_meta.close()
+        writer.commit(info={"added": metadata.get("row_index")})
+    except BaseException:
+        writer.abort()
+        raise
+    SNAPSHOT.refresh()
+    return get_snapshot()
 
-def retrieve(query, index, meta, top_k=4, sheet_filter=None):
-    if index is None:
+def with_duplicates(idx, item, duplicates):
+    # Agrega al resultado las otras filas (sheet, row_index) que comparten este vector
+    dups = duplicates.get(int(idx))
+    if not dups:
+        return item
+    return {**item, "metadata": {**item["metadata"], "duplicates": dups}}
+
+def _dense_ranking(queries, snapshot, depth, filters, shards, collapse, q_emb=None):
+    # Ids de documento (chunks ya agrupados) de cada consulta, de mejor a peor.
+    # Un solo encode y una búsqueda matricial (una por hoja con filtro).
+    import numpy as np
+    import faiss_index
+    from chunking import collapse_hits
+    index, parents, rescore = snapshot.index, snapshot.parents, snapshot.rescore
+    if q_emb is None:
+        q_emb = encode(queries)
+    # Con chunks varios hits pueden ser del mismo documento: se trae de más y se agrupan
+    fetch = depth*3 if parents is not None else depth
+    groups = {}
+    for q, f in enumerate(filters):
+        groups.setdefault(f.lower() if f else None, []).append(q)
+    results = [[] for _ in queries]
+    pending = list(range(len(queries)))
+    while pending:
+        waiting = set(pending)
+        # Cada hoja se busca de una vez: en su shard, o en el índice con los ids de la hoja
+        k = min(fetch * rescore[1], index.ntotal) if rescore else min(fetch, index.ntotal)
+        D = np.full((len(queries), k), np.inf, dtype=np.float32)
+        I = np.full((len(queries), k), -1, dtype=np.int64)
+        for f, rows in groups.items():
+            rows = [q for q in rows if q in waiting]
+            if not rows:
+                continue
+            if shards is not None:
+                D[rows], I[rows] = shards.search(q_emb[rows], k, sheet=f)
+            elif f is not None and snapshot.sheet_filter is not None:
+                D[rows], I[rows] = snapshot.sheet_filter.search(index, q_emb[rows], k, f)
+            else:
+                D[rows], I[rows] = index.search(q_emb[rows], k)
+        if rescore is not None:
+            D, I = faiss_index.rescore(q_emb, D, I, rescore[0], min(fetch, k))
+        for q in pending:
+            results[q] = collapse_hits(D[q], I[q], parents, mode=collapse)[:depth]
+        # Si los chunks de un mismo documento ocuparon lugares, se vuelve a buscar con más
+        pending = [q for q in pending if len(results[q]) < depth and k < index.ntotal]
+        fetch *= 4
+    return results
+
+def _lexical_ranking(queries, snapshot, depth, filters):
+    from chunking import collapse_hits
+    results = []
+    for q, f in zip(queries, filters):
+        ids = snapshot.sheet_filter.ids(f) if f and snapshot.sheet_filter is not None else None
+        fetch = depth*3 if snapshot.parents is not None else depth
+        scores, hits = snapshot.lexical.search(q, fetch, ids)
+        results.append(collapse_hits(-scores, hits, snapshot.parents)[:depth])
+    return results
+
+def _code_hits(query, snapshot, sheet_filter):
+    # Filas que tienen los códigos nombrados en la consulta (chunks -> su documento)
+    import numpy as np
+    from chunking import parent_ids
+    ids, complete = snapshot.codes.lookup_query(query)
+    if not ids:
+        return [], False
+    ids = parent_ids(ids, snapshot.parents)
+    if sheet_filter and snapshot.sheet_filter is not None:
+        ids = ids[np.isin(ids, snapshot.sheet_filter.ids(sheet_filter))]
+    return list(dict.fromkeys(int(i) for i in ids)), complete and len(ids) > 0
+
+def retrieve_many(queries, snapshot=None, top_k=4, sheet_filters=None, shards=None, collapse="max", mode=None):
+    # Todas las consultas de una vez: un encode y una búsqueda matricial para las que usan vectores.
+    # snapshot: la versión del índice con la que buscar (get_snapshot()); None usa el servicio
+    # de búsqueda si está levantado y si no la versión actual.
+    # sheet_filters: None, una hoja para todas o una lista con la hoja (o None) de cada consulta.
+    # mode: uno de RETRIEVAL_MODES (por defecto RETRIEVAL_MODE); sin índice BM25 es siempre dense.
+    # shards: un router propio; el servicio usa los suyos, así que con shards se busca acá.
+    global _CLIENT
+    queries = list(queries)
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Modo desconocido: {mode}. Opciones: {', '.join(RETRIEVAL_MODES)}")
+    if collapse not in COLLAPSE_MODES:
+        raise ValueError(f"collapse desconocido: {collapse}. Opciones: {', '.join(COLLAPSE_MODES)}")
+    client = get_client() if snapshot is None and shards is None else None
+    if client is not None and queries:
+        try:
+            return client.search_batch(queries, top_k=top_k, sheet_filters=sheet_filters, mode=mode,
+                                       collapse=collapse)
+        except RetrievalServerError as e:
+            print(f"(El servicio de búsqueda falló, se busca en este proceso: {e})")
+            _CLIENT = None
+    if snapshot is None:
+        snapshot = get_snapshot()
+    index, meta = snapshot.index, snapshot.meta
+    if index is None or not queries:
+        return [[] for _ in queries]
+    if sheet_filters is None or isinstance(sheet_filters, str):
+        sheet_filters = [sheet_filters] * len(queries)
+    filters = list(sheet_filters)
+    if shards is None:
+        shards = snapshot.shards
+    if snapshot.lexical is None:
+        mode = "dense"
+    # Los códigos exactos van primero; una consulta que es solo códigos no busca nada más
+    exact = [_code_hits(q, snapshot, f) if snapshot.codes is not None else ([], False)
+             for q, f in zip(queries, filters)]
+    todo = [q for q in range(len(queries)) if not exact[q][1]]
+    # Consultas parecidas a otras recientes (misma hoja, top_k y modo) salen del cache
+    cache = get_query_cache(snapshot.version)
+    cached, emb = {}, {}
+    if cache is not None and todo:
+        from lexical import is_code_query
+        # Los códigos solo se buscan por texto exacto: CONT12 y CONT13 se parecen demasiado
+        semantic = [q for q in todo if mode != "lexical" and not exact[q][0] and not is_code_query(queries[q])]
+        if semantic:
+            emb = dict(zip(semantic, encode([queries[q] for q in semantic])))
+        for q in todo:
+            hit = cache.get(queries[q], _cache_scope(filters[q], top_k, mode, collapse), emb.get(q))
+            if hit is not None:
+                cached[q] = hit
+        todo = [q for q in todo if q not in cached]
+    ranked = _ranked_ids([queries[q] for q in todo], snapshot, top_k, [filters[q] for q in todo], shards,
+                         collapse, mode, [emb.get(q) for q in todo])
+    for q, ids in zip(todo, ranked):
+        cached[q] = ids
+        if cache is not None:
+            cache.put(queries[q], _cache_scope(filters[q], top_k, mode, collapse), ids, emb.get(q))
+    results = []
+    for q in range(len(queries)):
+        ids = exact[q][0] + (cached[q] if not exact[q][1] else [])
+        results.append([with_duplicates(idx, meta[idx], snapshot.duplicates) for idx in list(dict.fromkeys(ids))[:top_k]])
+    return results
+
+def _cache_scope(sheet_filter, top_k, mode, collapse):
+    return ("retrieve", (sheet_filter or "").lower(), top_k, mode, collapse)
+
+def _ranked_ids(queries, snapshot, top_k, filters, shards, collapse, mode, embeddings=None):
+    # embeddings: los de las consultas que ya se codificaron (o None), para no repetir el encode
+    import numpy as np
+    from lexical import is_code_query, rrf
+    if not queries:
         return []
-    q_emb = MODEL.encode([query], convert_to_numpy=True)
-    D, I = index.search(q_emb, min(top_k*3, max(1, index.ntotal)))
+    depth = top_k * HYBRID_DEPTH if mode == "hybrid" else top_k
+    lexical = _lexical_ranking(queries, snapshot, depth, filters) if mode != "dense" else [None] * len(queries)
+    # Un código con resultados en BM25 no necesita el modelo
+    dense_q = [q for q in range(len(queries))
+               if mode == "dense" or (mode == "hybrid" and not (lexical[q] and is_code_query(queries[q])))]
+    dense = [None] * len(queries)
+    if dense_q:
+        known = [embeddings[q] for q in dense_q] if embeddings is not None else [None]
+        q_emb = np.vstack(known) if all(e is not None for e in known) else None
+        ranked = _dense_ranking([queries[q] for q in dense_q], snapshot, depth, [filters[q] for q in dense_q],
+                                shards, collapse, q_emb)
+        for q, ids in zip(dense_q, ranked):
+            dense[q] = ids
     results = []
-    for idx in I[0]:
-        if idx < 0:
-            continue
-        item = meta[idx]
-        if sheet_filter:
-            if item["metadata"].get("sheet", "").lower() != sheet_filter.lower():
-                continue
-        results.append(item)
-        if len(results) >= top_k:
-            break
+    for q in range(len(queries)):
+        if dense[q] is None:
+            results.append(lexical[q][:top_k])
+        elif lexical[q] is None:
+            results.append(dense[q][:top_k])
+        else:
+            results.append(rrf([dense[q], lexical[q]], top_k))
     return results
 
+def retrieve(query, snapshot=None, top_k=4, sheet_filter=None, shards=None, collapse="max", mode=None):
+    return retrieve_many([query], snapshot, top_k=top_k, sheet_filters=[sheet_filter], shards=shards,
+                         collapse=collapse, mode=mode)[0]
+
 def log_query(question, response, contexts):
     os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
     headers = ["timestamp","question","response","contexts"]
@@ -87,9 +423,31 @@ def log_query(question, response, contexts):
         ctx_short = " | ".join([f"{c['metadata'].get('sheet')}#{c['metadata'].get('row_index')}" for c in contexts])
         writer.writerow([datetime.datetime.now().isoformat(), question, response.replace("\n"," "), ctx_short])
 
+def replay_log(path=LOG_PATH, top_k=5):
+    # Vuelve a correr las preguntas del log de una sola vez (un encode y una búsqueda)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        questions = [row["question"] for row in csv.DictReader(f)
+                     if row.get("question") and not row["question"].lower().startswith(("add:", "suggest:"))]
+    snapshot = snapshot_for_search()
+    t0 = time.perf_counter()
+    results = retrieve_many(questions, snapshot, top_k=top_k)
+    elapsed = time.perf_counter() - t0
+    empty = sum(1 for r in results if not r)
+    print(f"{len(questions)} preguntas en {elapsed:.2f}s ({len(questions) / max(elapsed, 1e-9):.0f}/s), {empty} sin resultados")
+    return questions, results
+
 def ask_openai(question, contexts):
     if not OPENAI_KEY:
         return None
+    # La misma pregunta (o una muy parecida) con las mismas fuentes reutiliza la respuesta.
+    # Con el servicio de búsqueda levantado no se carga el modelo: solo texto exacto.
+    cache = get_query_cache()
+    scope = ("answer",) + tuple(f"{c['metadata'].get('sheet')}#{c['metadata'].get('row_index')}" for c in contexts)
+    emb = encode([question])[0] if cache is not None and get_client() is None else None
+    if cache is not None:
+        answer = cache.get(question, scope, emb)
+        if answer is not None:
+            return answer
     import openai
     openai.api_key = OPENAI_KEY
     system = "Eres un asistente pedagógico que sugiere mejoras y alternativas didácticas basadas en las fuentes entregadas."
@@ -101,17 +459,22 @@ def ask_openai(question, contexts):
         max_tokens=400,
         temperature=0.3
     )
-    return resp.choices[0].message.content.strip()
+    answer = resp.choices[0].message.content.strip()
+    if cache is not None:
+        cache.put(question, scope, answer, emb)
+    return answer
 
-def interactive_loop():
+def interactive_loop(warmup=True):
     print("Bot (incremental) iniciado. Comandos especiales:")
     print(" - Para filtrar por sheet: sheet:Nombre pregunta")
     print(" - Para añadir un consejo/entrada y que se indexe ahora: add:SheetName|TextoTitulo|TextoCuerpo")
     print(" - Para pedir sugerencias/alternativas de mejora (usa OpenAI si tenés key): suggest:Materia|Año|Pregunta")
     print(" - Ver log: log")
+    print(" - Ver estadísticas del cache de embeddings y de consultas: cache")
     print(" - Salir: exit\n")
 
-    index, meta = load_index_and_meta()
+    if warmup:
+        warm_up()
     while True:
         q = input("Pregunta> ").strip()
         if not q:
@@ -126,6 +489,13 @@ def interactive_loop():
             else:
                 print("No hay log todavía.")
             continue
+        if q.lower() == "cache":
+            from embedding_cache import get_cache, format_stats
+            print(format_stats(get_cache().stats()))
+            if get_query_cache() is not None:
+                from query_cache import format_stats as format_query_stats
+                print(format_query_stats(get_query_cache().stats()))
+            continue
 
         # Comando ADD: add:Sheet|Titulo|Cuerpo
         if q.lower().startswith("add:"):
@@ -134,7 +504,7 @@ def interactive_loop():
                 sheet,name,body = payload.split("|",2)
                 text = f"Titulo: {name}\nContenido: {body}"
                 metadata = {"sheet": sheet, "row_index": f"manual_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"}
-                index, meta = add_document_to_index(text, metadata, index, meta)
+                add_document_to_index(text, metadata, get_snapshot())
                 print("Entrada añadida e indexada ✅")
             except Exception as e:
                 print("Error en formato add. Usa: add:SheetName|Titulo|Cuerpo")
@@ -149,8 +519,7 @@ def interactive_loop():
                 sheet_filter = None
                 # intentar filtrar por materia
                 sheet_filter = materia
-                index, meta = load_index_and_meta()
-                contexts = retrieve(consulta, index, meta, top_k=6, sheet_filter=sheet_filter)
+                contexts = retrieve(consulta, snapshot_for_search(), top_k=6, sheet_filter=sheet_filter)
                 suggestion = ask_openai(consulta, contexts)
                 if suggestion:
                     print("\n== Sugerencias del modelo ==\n")
@@ -178,8 +547,7 @@ def interactive_loop():
                 print("Formato sheet inválido. Usa: sheet:NOMBRE pregunta...")
                 continue
 
-        index, meta = load_index_and_meta()
-        contexts = retrieve(q, index, meta, top_k=5, sheet_filter=sheet_filter)
+        contexts = retrieve(q, snapshot_for_search(), top_k=5, sheet_filter=sheet_filter)
         if not contexts:
             print("No encontré resultados relevantes.")
             log_query(q, "No results", [])
@@ -208,4 +576,30 @@ def interactive_loop():
             log_query(q, "Shown sources only", contexts)
 
 if __name__ == "__main__":
-    interactive_loop()
+    parser = argparse.ArgumentParser(description="Bot de consultas sobre el índice del Excel, con altas incrementales")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="no precargar modelo e índice al arrancar (se cargan con la primera pregunta)")
+    parser.add_argument("--backend", choices=["torch", "onnx", "onnx-int8"], default=ENCODER_BACKEND,
+                        help="backend para los embeddings de las consultas (también por ENCODER_BACKEND)")
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, default=RETRIEVAL_MODE,
+                        help="dense, lexical (BM25) o hybrid (ambos con RRF); también por RETRIEVAL_MODE")
+    parser.add_argument("--server", default=RETRIEVAL_SERVER, metavar="ADDRESS",
+                        help="servicio de búsqueda a usar si está corriendo (host:puerto o unix:/ruta.sock; "
+                             "off para buscar siempre en este proceso); también por RETRIEVAL_SERVER")
+    parser.add_argument("--no-query-cache", action="store_true",
+                        help="no reutilizar resultados de consultas parecidas (también QUERY_CACHE=off)")
+    parser.add_argument("--mmap", action="store_true",
+                        help="abrir el índice con mmap y compartirlo con otros procesos (también FAISS_MMAP=1)")
+    parser.add_argument("--replay", nargs="?", const=LOG_PATH, metavar="CSV",
+                        help="recorrer las preguntas de un query_log.csv con retrieve_many y salir")
+    args = parser.parse_args()
+    ENCODER_BACKEND = args.backend
+    RETRIEVAL_MODE = args.mode
+    RETRIEVAL_SERVER = args.server
+    USE_QUERY_CACHE = USE_QUERY_CACHE and not args.no_query_cache
+    if args.mmap:
+        os.environ["FAISS_MMAP"] = "1"
+    if args.replay:
+        replay_log(args.replay)
+    else:
+        interactive_loop(warmup=not args.no_warmup)
@@ -0,0 +1,110 @@
+# src/checkpoint.py
+# Guarda los embeddings de cada tanda del indexer en index/checkpoint/ mientras corre.
+# Si la corrida se corta, --resume vuelve a leer el Excel pero toma los vectores de las
+# tandas ya terminadas en vez de calcularlos de nuevo. Cada tanda se identifica por el
+# hash de sus textos: si el Excel cambió desde el corte, se recalcula desde ahí.
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+CHECKPOINT_DIR = "checkpoint"
+PROGRESS_FILE = "progress.json"
+
+# Tandas (de chunk_size documentos) entre escrituras del checkpoint
+CHECKPOINT_EVERY = 5
+
+
+def checkpoint_dir(index_path):
+    return os.path.join(os.path.dirname(index_path) or ".", CHECKPOINT_DIR)
+
+
+def batch_digest(rows):
+    h = hashlib.sha1()
+    for r in rows:
+        h.update(r["hash"].encode("ascii"))
+    return h.hexdigest()
+
+
+class Checkpoint:
+    def __init__(self, path, model_name, chunk_size, every=CHECKPOINT_EVERY, resume=False):
+        self.path = path
+        self.every = every
+        self.header = {"model": model_name, "chunk_size": chunk_size}
+        self.batches = []
+        self._pending = []
+        self._files = {}
+        progress = self._read_progress() if resume else None
+        if progress is not None and {k: progress.get(k) for k in self.header} != self.header:
+            print("El checkpoint es de otro modelo o tamaño de tanda; se empieza de cero.")
+            progress = None
+        if progress is None:
+            self.clear()
+        else:
+            self.batches = progress["batches"]
+            print(f"Retomando: {len(self.batches)} tandas con embeddings en {self.path}")
+        if every:
+            os.makedirs(self.path, exist_ok=True)
+
+    def _read_progress(self):
+        path = os.path.join(self.path, PROGRESS_FILE)
+        if not os.path.exists(path):
+            print("No hay checkpoint para retomar; se empieza de cero.")
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get(self, b, rows):
+        # Vectores guardados de la tanda b, o None si no está o sus textos cambiaron
+        if b >= len(self.batches):
+            return None
+        entry = self.batches[b]
+        if entry["digest"] != batch_digest(rows):
+            print(f"La tanda {b} cambió desde el corte; se recalcula desde ahí.")
+            self._truncate(b)
+            return None
+        name = entry["file"]
+        if name not in self._files:
+            self._files[name] = np.load(os.path.join(self.path, name), mmap_mode="r")
+        return np.array(self._files[name][entry["start"]:entry["start"] + entry["count"]], dtype=np.float32)
+
+    def _truncate(self, b):
+        # Las tandas desde b quedan inválidas; sus archivos se pisan en las próximas escrituras
+        self.batches = self.batches[:b]
+        self._files = {}
+        self._write_progress()
+
+    def add(self, b, rows, vectors):
+        if not self.every:
+            return
+        self._pending.append((b, batch_digest(rows), vectors))
+        if len(self._pending) >= self.every:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        first, last = self._pending[0][0], self._pending[-1][0]
+        name = f"vectors_{first:06d}_{last:06d}.npy"
+        tmp = os.path.join(self.path, name + ".tmp.npy")
+        np.save(tmp, np.concatenate([v for _, _, v in self._pending]))
+        os.replace(tmp, os.path.join(self.path, name))
+        start = 0
+        for b, digest, vectors in self._pending:
+            self.batches.append({"digest": digest, "file": name, "start": start, "count": len(vectors)})
+            start += len(vectors)
+        self._pending = []
+        self._write_progress()
+
+    def _write_progress(self):
+        # progress.json se reemplaza entero: un corte a mitad de escritura deja el anterior
+        tmp = os.path.join(self.path, PROGRESS_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**self.header, "batches": self.batches}, f)
+        os.replace(tmp, os.path.join(self.path, PROGRESS_FILE))
+
+    def clear(self):
+        self._files = {}
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
@@ -0,0 +1,97 @@
+# src/chunking.py
+# all-MiniLM-L6-v2 corta la entrada en 256 word pieces: las filas largas se parten en
+# ventanas solapadas. La fila completa sigue siendo un único documento (su vector cubre
+# el comienzo) y cada ventana extra es un registro "chunk" que apunta a su padre.
+# chunk_parents.npy guarda, para cada id de FAISS, el id del documento padre.
+import os
+import re
+import numpy as np
+
+# Palabras por ventana; en castellano cada palabra son ~1.5-2 word pieces
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 30
+
+_WORD = re.compile(r"\S+")
+
+
+def parents_path(index_path):
+    return os.path.join(os.path.dirname(index_path) or ".", "chunk_parents.npy")
+
+
+def split_chunks(text, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    # Ventanas de `size` palabras que avanzan de a size - overlap, respetando los saltos de línea
+    spans = [m.span() for m in _WORD.finditer(text)]
+    if len(spans) <= size:
+        return [text]
+    step = max(1, size - overlap)
+    chunks = []
+    for start in range(0, len(spans), step):
+        end = min(start + size, len(spans))
+        chunks.append(text[spans[start][0]:spans[end - 1][1]])
+        if end == len(spans):
+            break
+    return chunks
+
+
+class Chunker:
+    def __init__(self, size=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+        self.size = size
+        self.overlap = overlap
+        # id del padre para cada registro emitido, y id de cada documento de entrada
+        self.parents = []
+        self.doc_ids = []
+        self.chunks = 0
+
+    def expand(self, documents):
+        for doc in documents:
+            pid = len(self.parents)
+            self.parents.append(pid)
+            self.doc_ids.append(pid)
+            yield doc
+            if not self.size:
+                continue
+            for i, chunk in enumerate(split_chunks(doc["text"], self.size, self.overlap)[1:], 1):
+                self.parents.append(pid)
+                self.chunks += 1
+                yield {"text": chunk, "metadata": {**doc["metadata"], "chunk": i, "parent": pid}}
+
+    def save(self, index_path):
+        if self.chunks:
+            np.save(parents_path(index_path), np.asarray(self.parents, dtype=np.int64))
+        else:
+            remove_parents_file(index_path)
+
+
+def load_parents(index_path):
+    path = parents_path(index_path)
+    return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+
+def remove_parents_file(index_path):
+    if os.path.exists(parents_path(index_path)):
+        os.remove(parents_path(index_path))
+
+
+def parent_ids(ids, parents):
+    # ids agregados después de indexar (add: en el chat) no tienen chunks: son su propio padre
+    ids = np.asarray(ids, dtype=np.int64)
+    if parents is None:
+        return ids
+    inside = (ids >= 0) & (ids < len(parents))
+    return np.where(inside, np.asarray(parents)[np.where(inside, ids, 0)], ids)
+
+
+def collapse_hits(D, I, parents, mode="max"):
+    # Junta los hits de varios chunks en su documento padre. "max" se queda con la mejor
+    # distancia; "sum" suma similitudes (1 - d/2 para vectores normalizados) y premia
+    # los documentos con varios chunks cerca de la consulta.
+    scores = {}
+    for d, pid in zip(D, parent_ids(I, parents)):
+        if pid < 0:
+            continue
+        pid = int(pid)
+        if mode == "sum":
+            scores[pid] = scores.get(pid, 0.0) + (1.0 - float(d) / 2.0)
+        else:
+            scores[pid] = max(scores.get(pid, -np.inf), -float(d))
+    return sorted(scores, key=scores.get, reverse=True)
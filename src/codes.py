@@ -0,0 +1,95 @@
+# src/codes.py
+# Índice exacto de códigos: valores con forma de identificador (CONT12, PROV2, ESP-001,
+# NES-BACHI-...-4-EDI) y nombres de columna como ContenidoID, cada uno con los ids de
+# FAISS de las filas donde aparece. Una consulta que nombra un código se responde con
+# un lookup en un dict, sin modelo ni búsqueda vectorial.
+# Se guarda en codes.json junto al índice.
+import os
+import re
+import json
+from lexical import STOPWORDS, fold
+
+CODES_FILE = "codes.json"
+
+# Letras y números, con - o _ entre partes; tiene que tener un número, un separador o una
+# mayúscula en el medio (ContenidoID). Las palabras comunes y los números solos no cuentan.
+_CODE = re.compile(r"^[A-Za-z][A-Za-z0-9]*(?:[-_][A-Za-z0-9]+)*$")
+_HINT = re.compile(r"\d|[-_]|[a-z][A-Z]")
+_FIELD = re.compile(r"^[^:\n]{1,80}:[ \t]*(.+?)[ \t]*$", re.MULTILINE)
+_QUERY_TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_\-]*")
+
+
+def codes_path(index_path):
+    return os.path.join(os.path.dirname(index_path) or ".", CODES_FILE)
+
+
+def is_code(value):
+    return 2 <= len(value) <= 80 and bool(_CODE.match(value)) and bool(_HINT.search(value))
+
+
+def normalize(code):
+    return code.upper()
+
+
+def extract_codes(text):
+    # (código, es_clave) de cada línea "Campo: valor"; la primera línea es la clave de la fila
+    found = {}
+    for pos, m in enumerate(_FIELD.finditer(text)):
+        value = m.group(1)
+        if is_code(value):
+            code = normalize(value)
+            found[code] = found.get(code, False) or pos == 0
+    return found
+
+
+class CodeIndex:
+    def __init__(self, entries=None):
+        # código -> ids; primero las filas donde es la clave, después las que lo referencian
+        self.entries = entries or {}
+        self._keys = {}
+        self._refs = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, doc_id, text):
+        for code, key in extract_codes(text).items():
+            (self._keys if key else self._refs).setdefault(code, []).append(doc_id)
+        return self
+
+    def _merge(self):
+        for code in set(self._keys) | set(self._refs):
+            ids = self.entries.get(code, [])
+            self.entries[code] = list(dict.fromkeys(self._keys.get(code, []) + ids + self._refs.get(code, [])))
+        self._keys, self._refs = {}, {}
+
+    def lookup(self, code):
+        return self.entries.get(normalize(code), [])
+
+    def lookup_query(self, query):
+        # (ids, completa): completa si todas las palabras que no son stopwords son códigos conocidos.
+        # No se pide forma de código: "contenidoid" en minúsculas también encuentra CONTENIDOID
+        ids, complete = [], True
+        for word in query.split():
+            tokens = [t.strip("-_") for t in _QUERY_TOKEN.findall(word)]
+            hits = [i for t in tokens for i in self.lookup(t)]
+            ids.extend(hits)
+            if not hits and fold(word.strip("¿?¡!.,;:\"'()")) not in STOPWORDS:
+                complete = False
+        return list(dict.fromkeys(ids)), complete and bool(ids)
+
+    def save(self, index_path):
+        self._merge()
+        tmp = codes_path(index_path) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, codes_path(index_path))
+        return len(self.entries)
+
+    @classmethod
+    def load(cls, index_path):
+        path = codes_path(index_path)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
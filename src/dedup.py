@@ -0,0 +1,131 @@
+# src/dedup.py
+# Colapsa filas repetidas antes de calcular embeddings. Por defecto solo las idénticas
+# (sha1 del texto); con un umbral también las casi idénticas (MinHash + LSH sobre bigramas
+# de palabras). Se guarda un solo vector por grupo y las demás filas quedan en
+# duplicates.json, junto al índice: su metadata y, si el texto no era el mismo, su texto.
+import os
+import re
+import json
+import zlib
+import hashlib
+import unicodedata
+import numpy as np
+from codes import extract_codes
+
+NUM_PERM = 64
+BANDS = 16
+# None = solo duplicados exactos; colapsar casi duplicados es opcional (--dedup-threshold 0.9):
+# filas como CONT1..CONT7 se parecen mucho y se juntaban sin que se pudiera prever cuáles
+DEFAULT_THRESHOLD = None
+
+# Primo > 2^32 para el hashing universal (a*h + b) mod P sin desbordar uint64
+_PRIME = np.uint64(4294967311)
+_TOKEN = re.compile(r"\w+")
+
+
+def duplicates_path(index_path):
+    return os.path.join(os.path.dirname(index_path) or ".", "duplicates.json")
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def shingles(text):
+    words = _TOKEN.findall(_fold(text))
+    if len(words) < 2:
+        grams = words
+    else:
+        grams = [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return np.fromiter({zlib.crc32(g.encode("utf-8")) for g in grams}, dtype=np.uint64)
+
+
+class NearDuplicateFilter:
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, bands=BANDS, seed=0):
+        if num_perm % bands:
+            raise ValueError("num_perm tiene que ser múltiplo de bands")
+        rng = np.random.default_rng(seed)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._a = rng.integers(1, 2**31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**31, num_perm, dtype=np.uint64)
+        self._buckets = [{} for _ in range(bands)]
+        # sha1 del texto -> representante: no se guarda el texto de cada fila durante toda la corrida
+        self._exact = {}
+        # Firmas MinHash de los representantes (solo con umbral: ~256 bytes por fila más los buckets)
+        self._signatures = []
+        self.n = 0
+        # posición del representante (en lo que se devolvió) -> filas colapsadas en él
+        self.duplicates = {}
+        # Códigos (CONT12, PROV2...) de cada representante que tiene alguno: dos filas con
+        # códigos distintos no se colapsan aunque el resto sea igual, así la búsqueda exacta
+        # de un código nunca devuelve la fila de otro
+        self._codes = {}
+        self.dropped = 0
+
+    def signature(self, text):
+        h = shingles(text)
+        if not len(h):
+            return np.full(len(self._a), np.iinfo(np.uint32).max, dtype=np.uint32)
+        return ((np.outer(self._a, h) + self._b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _find(self, key, sig, codes):
+        rep = self._exact.get(key)
+        if rep is not None or sig is None:
+            return rep
+        candidates = set()
+        for band, bucket in enumerate(self._buckets):
+            key = sig[band * self.rows:(band + 1) * self.rows].tobytes()
+            if key in bucket:
+                candidates.add(bucket[key])
+        for rep in sorted(candidates):
+            # Jaccard estimado = fracción de permutaciones con el mismo mínimo
+            if self._codes.get(rep, frozenset()) == codes and np.mean(self._signatures[rep] == sig) >= self.threshold:
+                return rep
+        return None
+
+    def filter(self, documents):
+        for doc in documents:
+            text = doc["text"]
+            sig = self.signature(text) if self.threshold else None
+            codes = frozenset(extract_codes(text)) if self.threshold else None
+            key = hashlib.sha1(text.encode("utf-8")).digest()
+            rep = self._find(key, sig, codes)
+            if rep is not None:
+                # Lo necesario para devolver la fila aunque no tenga vector propio
+                dup = dict(doc["metadata"])
+                if self._exact.get(key) != rep:
+                    dup["text"] = text
+                self.duplicates.setdefault(rep, []).append(dup)
+                self.dropped += 1
+                continue
+            rep = self.n
+            self.n += 1
+            self._exact[key] = rep
+            if sig is not None:
+                self._signatures.append(sig)
+                if codes:
+                    self._codes[rep] = codes
+                for band, bucket in enumerate(self._buckets):
+                    bucket.setdefault(sig[band * self.rows:(band + 1) * self.rows].tobytes(), rep)
+            yield doc
+
+    def save(self, index_path, ids=None):
+        # ids[k] = id final del k-ésimo representante, si otra etapa agregó registros en el medio
+        with open(duplicates_path(index_path), "w", encoding="utf-8") as f:
+            json.dump({str(ids[k] if ids else k): v for k, v in self.duplicates.items()}, f, ensure_ascii=False)
+
+
+def load_duplicates(index_path):
+    path = duplicates_path(index_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
+
+def remove_duplicates_file(index_path):
+    if os.path.exists(duplicates_path(index_path)):
+        os.remove(duplicates_path(index_path))
@@ -0,0 +1,97 @@
+# src/embed_pipeline.py
+# Embeddings por tandas de largo parecido: las filas cortas (MODALIDADES, tablas de códigos)
+# no se rellenan hasta el largo de las descripciones de CONTENIDOS_PRODUCIDOS.
+import os
+import time
+import numpy as np
+
+# (largo máximo en caracteres, multiplicador del batch_size); ~4 caracteres por token
+DEFAULT_BUCKETS = [(256, 4.0), (1024, 1.0), (None, 0.25)]
+
+# Por debajo de esta cantidad de textos no conviene levantar un proceso por núcleo
+MIN_TEXTS_FOR_POOL = 5000
+
+
+def bucketize(texts, buckets=DEFAULT_BUCKETS):
+    # Devuelve [(límite, índices ordenados por largo)] sin tandas vacías
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    order = np.argsort(lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    out = []
+    start = 0
+    for pos, (limit, _) in enumerate(buckets):
+        if limit is None or pos == len(buckets) - 1:
+            # la última tanda se queda con todo lo que sobre
+            end = len(order)
+        else:
+            end = int(np.searchsorted(sorted_lengths, limit, side="right"))
+        if end > start:
+            out.append((limit, order[start:end]))
+        start = max(start, end)
+    return out
+
+
+def resolve_workers(workers, n_texts):
+    if workers and workers > 0:
+        return workers
+    # 0 = automático: todos los núcleos, solo si el volumen lo justifica
+    cpus = os.cpu_count() or 1
+    return cpus if n_texts >= MIN_TEXTS_FOR_POOL else 1
+
+
+def start_pool(model, workers):
+    # Cada proceso usa un hilo por núcleo que le toca, si no compiten entre sí
+    previous = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // workers))
+    try:
+        return model.start_multi_process_pool(target_devices=["cpu"] * workers)
+    finally:
+        if previous is None:
+            os.environ.pop("OMP_NUM_THREADS", None)
+        else:
+            os.environ["OMP_NUM_THREADS"] = previous
+
+
+def stop_pool(model, pool):
+    if pool is not None:
+        model.stop_multi_process_pool(pool)
+
+
+def encode_bucketed(model, texts, batch_size=64, workers=1, buckets=DEFAULT_BUCKETS, show_progress_bar=True, pool=None):
+    # Con pool=None y workers > 1 se levanta un pool solo para esta llamada
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    own_pool = pool is None
+    if own_pool:
+        workers = resolve_workers(workers, len(texts))
+        pool = start_pool(model, workers) if workers > 1 else None
+    else:
+        workers = len(pool["processes"])
+    multipliers = {limit: mult for limit, mult in buckets}
+    out = None
+    t_total = time.perf_counter()
+    try:
+        for limit, idx in bucketize(texts, buckets):
+            bs = max(1, int(batch_size * multipliers[limit]))
+            chunk = [texts[i] for i in idx]
+            t0 = time.perf_counter()
+            if pool is not None:
+                emb = model.encode_multi_process(chunk, pool, batch_size=bs)
+            else:
+                emb = model.encode(chunk, batch_size=bs, show_progress_bar=show_progress_bar, convert_to_numpy=True)
+            elapsed = time.perf_counter() - t0
+            if out is None:
+                out = np.empty((len(texts), emb.shape[1]), dtype=np.float32)
+            # Se vuelve a poner cada vector en la posición original del texto
+            out[idx] = emb
+            label = f"<= {limit} caracteres" if limit is not None else "largos"
+            print(f"  Tanda {label}: {len(chunk)} filas, batch {bs}, {elapsed:.1f}s "
+                  f"({len(chunk) / max(elapsed, 1e-9):.0f} filas/s)")
+    finally:
+        if own_pool:
+            stop_pool(model, pool)
+    elapsed = time.perf_counter() - t_total
+    print(f"  Total: {len(texts)} filas en {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.0f} filas/s, "
+          f"{workers} proceso{'s' if workers > 1 else ''})")
+    return out
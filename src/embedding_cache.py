@@ -0,0 +1,135 @@
+# src/embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "index/embedding_cache.sqlite")
+MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# SQLite limita la cantidad de parámetros por consulta
+_CHUNK = 900
+
+
+def normalize_text(text):
+    return " ".join(str(text).split())
+
+
+def cache_key(model_name, text):
+    return hashlib.sha1(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def _get_many(self, keys):
+        found = {}
+        for i in range(0, len(keys), _CHUNK):
+            chunk = keys[i:i + _CHUNK]
+            marks = ",".join("?" * len(chunk))
+            for key, dim, blob in self._conn.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({marks})", chunk):
+                found[key] = np.frombuffer(blob, dtype=np.float32, count=dim)
+        return found
+
+    def _touch(self, keys, now):
+        for i in range(0, len(keys), _CHUNK):
+            chunk = keys[i:i + _CHUNK]
+            marks = ",".join("?" * len(chunk))
+            self._conn.execute(f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now, *chunk])
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        extra = count - self.max_entries
+        if extra > 0:
+            # LRU: se van los que hace más tiempo que no se usan
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)", (extra,))
+
+    def encode(self, model_name, texts, encode_fn):
+        # encode_fn(lista_de_textos) -> array (n, dim); solo se llama con los textos que faltan
+        texts = list(texts)
+        keys = [cache_key(model_name, t) for t in texts]
+        with self._lock:
+            found = self._get_many(sorted(set(keys)))
+        pending = {}
+        for i, key in enumerate(keys):
+            if key not in found and key not in pending:
+                pending[key] = i
+        n_missing = sum(1 for k in keys if k not in found)
+        with self._lock:
+            self.hits += len(keys) - n_missing
+            self.misses += n_missing
+
+        if pending:
+            t0 = time.perf_counter()
+            vectors = np.asarray(encode_fn([texts[i] for i in pending.values()]), dtype=np.float32)
+            now = time.time()
+            with self._lock:
+                self.encode_seconds += time.perf_counter() - t0
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, dim, vector, last_used) VALUES (?, ?, ?, ?)",
+                    [(key, vec.shape[0], vec.tobytes(), now) for key, vec in zip(pending, vectors)])
+                self._evict()
+                self._conn.commit()
+            found.update(zip(pending, vectors))
+
+        with self._lock:
+            self._touch([k for k in set(keys) if k not in pending], time.time())
+            self._conn.commit()
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack([found[k] for k in keys])
+
+    def stats(self):
+        total = self.hits + self.misses
+        per_text = self.encode_seconds / self.misses if self.misses else 0.0
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "encode_seconds": round(self.encode_seconds, 3),
+            # estimación: lo que hubiera costado codificar los aciertos al ritmo de los fallos
+            "saved_seconds": round(self.hits * per_text, 3),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+
+
+def get_cache(path=CACHE_PATH):
+    if path not in _caches:
+        _caches[path] = EmbeddingCache(path)
+    return _caches[path]
+
+
+def format_stats(stats):
+    return (f"Cache de embeddings: {stats['hits']} aciertos, {stats['misses']} fallos "
+            f"({stats['hit_rate']:.0%}), {stats['entries']} entradas, "
+            f"{stats['encode_seconds']}s codificando, ~{stats['saved_seconds']}s ahorrados")
@@ -0,0 +1,187 @@
+# src/encoders.py
+# Backends para calcular embeddings: "torch" es SentenceTransformer tal cual; "onnx" y
+# "onnx-int8" corren el mismo modelo exportado a ONNX (el segundo con pesos cuantizados
+# a int8) con onnxruntime, bastante más rápido en CPU para consultas de a una.
+#
+#   python src/encoders.py --export          # exporta, cuantiza y compara contra torch
+#   python src/encoders.py --check --backend onnx-int8
+#
+# Todos devuelven lo mismo que SentenceTransformer.encode (mean pooling + normalización),
+# así que indexer y chat los usan sin cambios. Los vectores de cada backend se guardan
+# en el cache con su propio nombre (encoder_id) para no mezclarlos.
+import os
+import json
+import argparse
+import numpy as np
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+DEFAULT_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ONNX_ROOT = os.getenv("ONNX_MODEL_DIR", "models/onnx")
+
+CONFIG_FILE = "export.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_FILE = "model-int8.onnx"
+
+# Similitud coseno mínima contra torch para aceptar un export
+MIN_COSINE = 0.99
+
+SAMPLE_TEXTS = [
+    "Matemática de primer año: números racionales y operaciones",
+    "¿Qué contenidos de Lengua hay para tercer año?",
+    "Comprensión lectora de textos expositivos en el ciclo básico",
+    "Revolución de Mayo y procesos de independencia",
+    "Célula, tejidos y sistemas del cuerpo humano",
+    "Taller de programación para la modalidad técnica",
+    "CONT12",
+    "Inglés, segundo bimestre, evaluación integradora",
+    "Proyectos de educación ambiental con recursos audiovisuales",
+    "Prácticas del lenguaje: escritura de textos argumentativos",
+]
+
+
+def encoder_id(model_name, backend):
+    return model_name if backend == "torch" else f"{model_name}+{backend}"
+
+
+def onnx_dir(model_name):
+    return os.path.join(ONNX_ROOT, model_name.replace("/", "__"))
+
+
+def export_onnx(model_name, out_dir=None, quantize=True, opset=14):
+    # Exporta el transformer (sin pooling) y guarda tokenizer y configuración al lado
+    import torch
+    from sentence_transformers import SentenceTransformer
+    out_dir = out_dir or onnx_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    sample = model.tokenizer(SAMPLE_TEXTS[:2], padding=True, return_tensors="pt")
+    inputs = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {n: {0: "batch", 1: "tokens"} for n in inputs + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(LastHiddenState(transformer), tuple(sample[n] for n in inputs),
+                          os.path.join(out_dir, MODEL_FILE), input_names=inputs,
+                          output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=opset)
+    model.tokenizer.save_pretrained(out_dir)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(os.path.join(out_dir, MODEL_FILE), os.path.join(out_dir, QUANTIZED_FILE),
+                         weight_type=QuantType.QInt8)
+    config = {
+        "model": model_name,
+        "inputs": inputs,
+        "max_seq_length": int(model.max_seq_length),
+        "dim": int(model.get_sentence_embedding_dimension()),
+        "normalize": any(type(m).__name__ == "Normalize" for m in model),
+    }
+    with open(os.path.join(out_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return out_dir
+
+
+class OnnxEncoder:
+    # Misma interfaz que usan embed_pipeline y el chat: encode() y get_sentence_embedding_dimension()
+    def __init__(self, model_dir, quantized=False, threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        with open(os.path.join(model_dir, CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        path = os.path.join(model_dir, QUANTIZED_FILE if quantized else MODEL_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No está {path}; exportalo con: python src/encoders.py --export")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.inputs = self.config["inputs"]
+        self.max_seq_length = self.config["max_seq_length"]
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dim"]
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = np.empty((len(texts), self.config["dim"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            tokens = self.tokenizer(batch, padding=True, truncation=True, max_length=self.max_seq_length,
+                                    return_tensors="np")
+            hidden = self.session.run(None, {n: tokens[n].astype(np.int64) for n in self.inputs})[0]
+            # Mean pooling sobre los tokens reales, como el módulo Pooling de sentence-transformers
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.config["normalize"]:
+                emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            out[start:start + len(batch)] = emb
+        return out[0] if single else out
+
+
+def load_encoder(model_name, backend=DEFAULT_BACKEND):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend}. Opciones: {', '.join(BACKENDS)}")
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    model_dir = onnx_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, CONFIG_FILE)):
+        print(f"No hay export ONNX de {model_name}; se genera en {model_dir} (una sola vez)...")
+        export_onnx(model_name, model_dir, quantize=backend == "onnx-int8")
+        # Un export que no da los mismos vectores que torch no se usa: se borra la
+        # configuración para que no quede como válido y se corta acá
+        cos = cosine_check(model_name, backend)
+        if cos.min() < MIN_COSINE:
+            os.remove(os.path.join(model_dir, CONFIG_FILE))
+            raise RuntimeError(f"El export ONNX ({backend}) de {model_name} da coseno mínimo {cos.min():.4f} "
+                               f"contra torch (menor a {MIN_COSINE}); usá --backend torch")
+        print(f"Export ONNX verificado: coseno mínimo {cos.min():.4f} contra torch")
+    return OnnxEncoder(model_dir, quantized=backend == "onnx-int8")
+
+
+def cosine_check(model_name, backend, texts=SAMPLE_TEXTS, reference=None):
+    # Similitud coseno fila a fila contra torch (o contra `reference` si ya está cargado)
+    reference = reference or load_encoder(model_name, "torch")
+    a = np.asarray(reference.encode(list(texts), convert_to_numpy=True), dtype=np.float32)
+    b = np.asarray(load_encoder(model_name, backend).encode(list(texts)), dtype=np.float32)
+    a /= np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b /= np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    return np.einsum("ij,ij->i", a, b)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta el modelo a ONNX y lo compara contra PyTorch")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--export", action="store_true", help="exportar (y cuantizar a int8) en " + ONNX_ROOT)
+    parser.add_argument("--no-quantize", action="store_true", help="exportar solo la versión float32")
+    parser.add_argument("--check", action="store_true", help="comparar los embeddings contra torch")
+    parser.add_argument("--backend", choices=BACKENDS[1:], nargs="+", default=None,
+                        help="backends a comparar (por defecto onnx y onnx-int8)")
+    args = parser.parse_args()
+
+    if args.export:
+        out = export_onnx(args.model, quantize=not args.no_quantize)
+        print(f"Modelo exportado en {out}")
+    if args.export or args.check:
+        backends = args.backend or (["onnx"] if args.no_quantize else ["onnx", "onnx-int8"])
+        reference = load_encoder(args.model, "torch")
+        failed = False
+        for backend in backends:
+            cos = cosine_check(args.model, backend, reference=reference)
+            ok = cos.min() >= MIN_COSINE
+            failed |= not ok
+            print(f"{backend}: coseno mínimo {cos.min():.4f}, promedio {cos.mean():.4f} "
+                  f"{'OK' if ok else f'(menor a {MIN_COSINE})'}")
+        if failed:
+            exit(1)
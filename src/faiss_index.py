@@ -0,0 +1,268 @@
+# src/faiss_index.py
+import os
+import json
+import math
+import faiss
+import numpy as np
+
+INDEX_TYPES = ["auto", "flat", "ivf", "hnsw", "ivfpq", "fp16", "sq8"]
+
+# Búsqueda exacta con los vectores guardados en 2 bytes (fp16) o 1 byte (sq8) por dimensión
+SCALAR_QUANTIZERS = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+# Con vectores cuantizados se traen rescore * k candidatos y se reordenan con los float32
+DEFAULT_RESCORE = 4
+
+# Perillas de búsqueda por variable de entorno (pisan lo guardado al indexar)
+ENV_NPROBE = "FAISS_NPROBE"
+ENV_EF_SEARCH = "FAISS_EF_SEARCH"
+# FAISS_MMAP=1: el índice se abre con mmap y no se copia al heap; varios procesos (workers
+# de Streamlit, chats, el servicio de búsqueda) comparten las mismas páginas del page cache
+ENV_MMAP = "FAISS_MMAP"
+
+# Filas por bloque en la búsqueda exacta sobre embeddings.npy
+MMAP_SEARCH_ROWS = 65536
+
+
+def params_path(index_path):
+    return index_path + ".json"
+
+
+def vectors_path(index_path):
+    # float32 en el orden de los ids del índice (lo escribe el indexer junto al manifiesto)
+    return os.path.join(os.path.dirname(index_path) or ".", "embeddings.npy")
+
+
+def choose_index_type(n):
+    # Hasta ~50k filas la búsqueda exacta sigue siendo de milisegundos
+    if n < 50_000:
+        return "flat"
+    if n < 1_000_000:
+        return "hnsw"
+    return "ivfpq"
+
+
+def _pq_subquantizers(dim):
+    # Sub-vectores de ~8 dimensiones (384 -> 48), m tiene que dividir a dim
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def default_params(index_type, n, dim):
+    params = {"index_type": index_type, "dim": int(dim)}
+    if index_type in ("ivf", "ivfpq"):
+        # faiss pide ~39 puntos por centroide para entrenar bien
+        nlist = int(min(max(1, 4 * math.sqrt(n)), max(1, n // 39)))
+        params["nlist"] = nlist
+        params["nprobe"] = min(nlist, max(8, nlist // 16))
+    if index_type == "ivfpq":
+        params["m"] = _pq_subquantizers(dim)
+        # 2^nbits centroides por sub-vector, también necesitan datos para entrenar
+        params["nbits"] = int(min(8, max(4, math.floor(math.log2(max(16, n // 39))))))
+    if index_type == "hnsw":
+        params["hnsw_m"] = 32
+        params["ef_construction"] = 200
+        params["ef_search"] = 64
+    if index_type in SCALAR_QUANTIZERS:
+        params["rescore"] = DEFAULT_RESCORE
+    return params
+
+
+def build_index(embeddings, index_type="auto", **overrides):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, dim = embeddings.shape
+    if index_type == "auto":
+        index_type = choose_index_type(n)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconocido: {index_type}. Opciones: {', '.join(INDEX_TYPES)}")
+    params = default_params(index_type, n, dim)
+    params.update({k: v for k, v in overrides.items() if v is not None})
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type in SCALAR_QUANTIZERS:
+        index = faiss.IndexScalarQuantizer(dim, SCALAR_QUANTIZERS[index_type], faiss.METRIC_L2)
+        # sq8 aprende el rango de cada dimensión; fp16 no necesita entrenamiento
+        index.train(embeddings)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"])
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["m"], params["nbits"])
+        # Muestra fija para que dos corridas con los mismos datos den el mismo índice
+        train_size = min(n, params["nlist"] * 256)
+        sample = np.random.default_rng(0).choice(n, size=train_size, replace=False)
+        index.train(embeddings[np.sort(sample)])
+        params["trained_on"] = int(train_size)
+
+    index.add(embeddings)
+    params["ntotal"] = int(index.ntotal)
+    apply_search_params(index, params)
+    return index, params
+
+
+def apply_search_params(index, params):
+    nprobe = params.get("nprobe")
+    ef_search = params.get("ef_search")
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = int(nprobe)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None and ef_search:
+        hnsw.efSearch = int(ef_search)
+
+
+def write_index(index, index_path, params=None):
+    faiss.write_index(index, index_path)
+    if params is None:
+        params = read_params(index_path)
+    params = dict(params, ntotal=int(index.ntotal))
+    with open(params_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(params, f, ensure_ascii=False, indent=2)
+
+
+def read_params(index_path):
+    path = params_path(index_path)
+    if not os.path.exists(path):
+        # índices viejos: IndexFlatL2 sin archivo de parámetros
+        return {"index_type": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def mmap_enabled():
+    return os.getenv(ENV_MMAP, "").lower() in ("1", "true", "yes", "on")
+
+
+def _mmap_flag(params):
+    # IVF: listas invertidas mapeadas. flat, hnsw, fp16, sq8: los códigos se leen del archivo
+    # sin copiarlos (IO_FLAG_MMAP_IFC, FAISS >= 1.10); None si esta versión no lo tiene.
+    if params.get("index_type") in ("ivf", "ivfpq"):
+        return faiss.IO_FLAG_MMAP
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+
+
+class MmapFlatIndex:
+    # Búsqueda exacta L2 sobre embeddings.npy abierto con mmap, para índices flat cuando FAISS
+    # no puede mapear el archivo. Solo lectura; misma forma de resultados que index.search.
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.ntotal = len(vectors)
+        self.d = vectors.shape[1]
+
+    def reconstruct(self, i):
+        return np.array(self.vectors[i], dtype=np.float32)
+
+    def search(self, q_emb, k):
+        q_emb = np.ascontiguousarray(q_emb, dtype=np.float32)
+        D = np.full((len(q_emb), 0), np.inf, dtype=np.float32)
+        I = np.full((len(q_emb), 0), -1, dtype=np.int64)
+        q_norms = (q_emb ** 2).sum(axis=1)[:, None]
+        for start in range(0, self.ntotal, MMAP_SEARCH_ROWS):
+            block = np.asarray(self.vectors[start:start + MMAP_SEARCH_ROWS], dtype=np.float32)
+            d = np.maximum(q_norms - 2 * q_emb @ block.T + (block ** 2).sum(axis=1)[None, :], 0)
+            D = np.hstack([D, d])
+            I = np.hstack([I, np.broadcast_to(np.arange(start, start + len(block)), d.shape)])
+            if D.shape[1] > k:
+                top = np.argpartition(D, k - 1, axis=1)[:, :k]
+                D, I = np.take_along_axis(D, top, axis=1), np.take_along_axis(I, top, axis=1)
+        order = np.argsort(D, axis=1, kind="stable")
+        D, I = np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+        if D.shape[1] < k:
+            pad = k - D.shape[1]
+            D = np.hstack([D, np.full((len(q_emb), pad), np.inf, dtype=np.float32)])
+            I = np.hstack([I, np.full((len(q_emb), pad), -1, dtype=np.int64)])
+        return D.astype(np.float32), I
+
+
+def _read_mmap(index_path, params):
+    flag = _mmap_flag(params)
+    if flag is not None:
+        return faiss.read_index(index_path, flag)
+    vectors = vectors_path(index_path)
+    if params.get("index_type") == "flat" and os.path.exists(vectors):
+        mapped = np.load(vectors, mmap_mode="r")
+        # Después de un add desde el chat el índice tiene filas que embeddings.npy no
+        if len(mapped) == params.get("ntotal", len(mapped)):
+            return MmapFlatIndex(mapped)
+    return faiss.read_index(index_path)
+
+
+def load_index(index_path, nprobe=None, ef_search=None, mmap=None):
+    # mmap None toma FAISS_MMAP. Un índice mapeado es de solo lectura: para agregar vectores
+    # hay que cargarlo con mmap=False.
+    params = read_params(index_path)
+    if mmap_enabled() if mmap is None else mmap:
+        index = _read_mmap(index_path, params)
+        if isinstance(index, MmapFlatIndex):
+            return index, params
+    else:
+        index = faiss.read_index(index_path)
+    nprobe = nprobe or os.getenv(ENV_NPROBE)
+    ef_search = ef_search or os.getenv(ENV_EF_SEARCH)
+    if nprobe and params.get("index_type") in ("ivf", "ivfpq"):
+        params["nprobe"] = int(nprobe)
+    if ef_search and params.get("index_type") == "hnsw":
+        params["ef_search"] = int(ef_search)
+    apply_search_params(index, params)
+    return index, params
+
+
+def load_rescore_vectors(index_path, params):
+    # (vectores float32 por mmap, factor) si el índice está cuantizado y hay embeddings.npy
+    factor = params.get("rescore")
+    path = vectors_path(index_path)
+    if not factor or not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r"), int(factor)
+
+
+def rescore(q_emb, D, I, vectors, k):
+    # Recalcula la distancia L2 exacta de los candidatos y se queda con los k mejores.
+    # Los ids que no están en vectors (altas manuales) conservan la distancia aproximada.
+    q_emb = np.asarray(q_emb, dtype=np.float32)
+    D = np.array(D, dtype=np.float32)
+    I = np.asarray(I, dtype=np.int64)
+    for q in range(len(I)):
+        exact = (I[q] >= 0) & (I[q] < len(vectors))
+        if exact.any():
+            diff = np.asarray(vectors[I[q][exact]], dtype=np.float32) - q_emb[q]
+            D[q, exact] = np.einsum("ij,ij->i", diff, diff)
+    D = np.where(I >= 0, D, np.inf)
+    order = np.argsort(D, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+
+def memory_bytes(index, params):
+    # Bytes de los vectores guardados en el índice contra float32 sin comprimir
+    n, dim = int(index.ntotal), int(params.get("dim", index.d))
+    code_size = getattr(faiss.downcast_index(index), "code_size", dim * 4)
+    return n * code_size, n * dim * 4
+
+
+def recall_at_k(index, embeddings, k=10, n_queries=500, rescore_factor=None, seed=0):
+    # Compara contra la búsqueda exacta en float32 usando filas del propio índice como consultas
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    k = min(k, len(embeddings))
+    pick = np.random.default_rng(seed).choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+    queries = embeddings[np.sort(pick)]
+    flat = faiss.IndexFlatL2(embeddings.shape[1])
+    flat.add(embeddings)
+    _, truth = flat.search(queries, k)
+    fetch = min(k * rescore_factor, index.ntotal) if rescore_factor else k
+    D, I = index.search(queries, fetch)
+    if rescore_factor:
+        D, I = rescore(queries, D, I, embeddings, k)
+    hits = sum(len(set(t) & set(i[:k])) for t, i in zip(truth, I))
+    return hits / truth.size
+
+
+def describe(params):
+    knobs = [f"{k}={params[k]}" for k in ("nlist", "nprobe", "m", "nbits", "hnsw_m", "ef_search", "rescore") if k in params]
+    return f"{params.get('index_type', 'flat')} ({', '.join(knobs)})" if knobs else params.get("index_type", "flat")
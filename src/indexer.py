@@ -1,74 +1,418 @@
 # src/indexer.py
 import os
 import json
+import time
+import hashlib
+import itertools
 import argparse
-import pandas as pd
-from sentence_transformers import SentenceTransformer
+from contextlib import contextmanager
 import numpy as np
-import faiss
 from tqdm import tqdm
+from embedding_cache import get_cache, format_stats
+import faiss_index
+import shards
+from dedup import NearDuplicateFilter, DEFAULT_THRESHOLD
+from chunking import Chunker, CHUNK_WORDS, CHUNK_OVERLAP
+from meta_store import MetaStoreWriter
+import snapshots
+from snapshots import SnapshotWriter
+from lexical import LexicalIndexBuilder
+from codes import CodeIndex
+from checkpoint import Checkpoint, CHECKPOINT_EVERY, checkpoint_dir
+from encoders import load_encoder, encoder_id, BACKENDS, DEFAULT_BACKEND
+from embed_pipeline import encode_bucketed, resolve_workers, start_pool, stop_pool
+from sources import iter_documents_from_sources, expand_sources, read_source
+
+# Documentos por tanda de embeddings. Con --workers 0 cada tanda decide sola si usa el pool
+# de procesos (embed_pipeline.MIN_TEXTS_FOR_POOL textos nuevos): tiene que poder superar ese mínimo.
+CHUNK_SIZE = 8192
 
 # Ruta por defecto a tu archivo (modifica si tu archivo tiene otro nombre)
 excel_path_default = r"C:\Users\grise\OneDrive\Escritorio\proyecto Gobierno de la ciudad\proyecto_bot_profesores\Ecosistema_modelo_BD -Equipo de prácticas.xlsx"
 
 
-def build_documents_from_excel(excel_path):
-    sheets = pd.read_excel(excel_path, sheet_name=None)
-    documents = []
-    for sheet_name, df in sheets.items():
-        df = df.fillna("")
-        for idx, row in df.iterrows():
-            parts = []
-            for col in df.columns:
-                val = str(row[col]).strip()
-                if val:
-                    parts.append(f"{col}: {val}")
-            text = "\n".join(parts).strip()
-            if not text:
-                continue
-            doc = {
-                "text": text,
-                "metadata": {
-                    "sheet": sheet_name,
-                    "row_index": int(idx)
-                }
-            }
-            documents.append(doc)
-    return documents
-
-
-def index_documents(documents, model_name="all-MiniLM-L6-v2", index_path="index/faiss.index", meta_path="index/metadata.json"):
-    os.makedirs(os.path.dirname(index_path), exist_ok=True)
-    model = SentenceTransformer(model_name)
-    texts = [d["text"] for d in documents]
-    print("Calculando embeddings...")
-    embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
-    faiss.write_index(index, index_path)
-    print(f"Índice FAISS guardado en {index_path}")
-
-    store = [{"metadata": d["metadata"], "text": d["text"]} for d in documents]
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(store, f, ensure_ascii=False, indent=2)
-    print(f"Metadatos guardados en {meta_path}")
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def manifest_paths(index_path):
+    index_dir = os.path.dirname(index_path) or "."
+    return os.path.join(index_dir, "row_manifest.json"), faiss_index.vectors_path(index_path)
+
+
+def load_manifest(index_path, model_name):
+    # Devuelve (filas, vectores) de la corrida anterior, o (None, None) si no sirven
+    manifest_path, emb_path = manifest_paths(index_path)
+    if not os.path.exists(manifest_path) or not os.path.exists(emb_path):
+        return None, None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("model") != model_name:
+        print(f"El manifiesto se generó con otro modelo ({manifest.get('model')}); se recalcula todo.")
+        return None, None
+    vectors = np.load(emb_path)
+    if len(vectors) != len(manifest["rows"]):
+        print("El manifiesto no coincide con embeddings.npy; se recalcula todo.")
+        return None, None
+    return manifest["rows"], vectors
+
+
+def save_manifest(index_path, model_name, rows, embeddings):
+    manifest_path, emb_path = manifest_paths(index_path)
+    np.save(emb_path, embeddings)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "rows": rows}, f, ensure_ascii=False)
+
+
+def manifest_row(doc, text):
+    row = {"sheet": doc["metadata"]["sheet"], "row_index": doc["metadata"]["row_index"], "hash": text_hash(text)}
+    if "chunk" in doc["metadata"]:
+        row["chunk"] = doc["metadata"]["chunk"]
+    if "source" in doc["metadata"]:
+        row["source"] = doc["metadata"]["source"]
+    return row
+
+
+def diff_manifest(old_rows, new_rows):
+    # Identidad de fila = (archivo, sheet, row_index, chunk); el hash dice si cambió el texto
+    old = {(r.get("source"), r["sheet"], r["row_index"], r.get("chunk", 0)): r["hash"] for r in old_rows}
+    new = {(r.get("source"), r["sheet"], r["row_index"], r.get("chunk", 0)): r["hash"] for r in new_rows}
+    added = sum(1 for k in new if k not in old)
+    changed = sum(1 for k, h in new.items() if k in old and old[k] != h)
+    removed = sum(1 for k in old if k not in new)
+    return added, changed, removed
+
+
+class LazyEncoder:
+    # Carga el modelo (y el pool de procesos) recién cuando hace falta calcular algo
+    def __init__(self, model_name, batch_size=64, workers=0, backend="torch"):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.workers = workers
+        self.model = None
+        self.pool = None
+
+    def __call__(self, texts):
+        if self.model is None:
+            self.model = load_encoder(self.model_name, self.backend)
+            print(f"Calculando embeddings ({self.backend})...")
+            if self.backend != "torch" and self.workers > 1:
+                print(f"  (--workers {self.workers} no se usa con {self.backend}: onnxruntime ya reparte entre los núcleos)")
+        # En automático (workers=0) se decide con lo que de verdad hay que calcular en esta tanda:
+        # en un re-indexado con pocas filas cambiadas no se levanta un proceso por núcleo.
+        # Un --workers explícito se respeta siempre.
+        # onnxruntime ya reparte cada batch entre los núcleos: el pool es solo para torch
+        pool = None
+        workers = resolve_workers(self.workers, len(texts)) if self.backend == "torch" else 1
+        if workers > 1:
+            if self.pool is None:
+                self.pool = start_pool(self.model, workers)
+            pool = self.pool
+        return encode_bucketed(self.model, texts, batch_size=self.batch_size, pool=pool)
+
+    def close(self):
+        if self.pool is not None:
+            stop_pool(self.model, self.pool)
+            self.pool = None
+
+
+class StageTimer:
+    # Segundos por etapa de index_documents (benchmarks/bench_indexer.py). Las etapas se
+    # anidan (la extracción corre adentro del next() del dedup, que corre adentro del de los
+    # chunks): cada una cuenta solo su tiempo propio, sin el de las de adentro.
+    def __init__(self):
+        self.seconds = {}
+        self._inner = []
+
+    @contextmanager
+    def stage(self, name):
+        self._inner.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            inner = self._inner.pop()
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - inner
+            if self._inner:
+                self._inner[-1] += elapsed
+
+    def iterate(self, name, iterable):
+        it = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+
+class _NoTimer(StageTimer):
+    # Sin medir: no agrega un perf_counter por documento a cada indexado
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def iterate(self, name, iterable):
+        return iterable
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def index_documents(documents, model_name="all-MiniLM-L6-v2", index_path="index/faiss.index", meta_path="index/metadata.json", incremental=True,
+                    index_type="auto", index_params=None, write_json=False, batch_size=64, workers=0, chunk_size=CHUNK_SIZE,
+                    build_shards=True, dedup_threshold=DEFAULT_THRESHOLD, chunk_words=CHUNK_WORDS,
+                    chunk_overlap=CHUNK_OVERLAP, resume=False, checkpoint_every=CHECKPOINT_EVERY, backend=DEFAULT_BACKEND,
+                    build_lexical=True, timer=None):
+    # documents puede ser una lista o un generador (sources.iter_documents_from_excel):
+    # se procesa de a chunk_size documentos, sin tenerlos todos en memoria.
+    # timer: un StageTimer para medir cada etapa
+    timer = timer or _NoTimer()
+    index_dir = os.path.dirname(index_path) or "."
+    os.makedirs(index_dir, exist_ok=True)
+    # Manifiesto, cache y checkpoint distinguen el backend: sus vectores no se mezclan
+    model_id = encoder_id(model_name, backend)
+    with timer.stage("manifest"):
+        old_rows, old_vectors = load_manifest(snapshots.resolve(index_path), model_id) if incremental else (None, None)
+        reusable = {}
+        if old_rows is not None:
+            for pos, r in enumerate(old_rows):
+                reusable.setdefault(r["hash"], pos)
+
+    cache = get_cache(os.path.join(index_dir, "embedding_cache.sqlite"))
+    encoder = LazyEncoder(model_name, batch_size, workers, backend=backend)
+    documents = timer.iterate("extraction", documents)
+    near_dups = NearDuplicateFilter(dedup_threshold) if dedup_threshold != 0 else None
+    if near_dups is not None:
+        documents = timer.iterate("dedup", near_dups.filter(documents))
+    # Las filas largas se expanden en ventanas después de deduplicar
+    chunker = Chunker(chunk_words, chunk_overlap)
+    documents = timer.iterate("chunking", chunker.expand(documents))
+    # Todo se escribe en una versión nueva; el chat sigue usando la anterior hasta el commit
+    snapshot = SnapshotWriter(index_dir)
+    out_index = snapshot.path(os.path.basename(index_path))
+    writer = MetaStoreWriter(snapshot.path(os.path.basename(meta_path)))
+    json_store = [] if write_json else None
+    # BM25 sobre los mismos textos que FAISS, para códigos y términos literales
+    lexicon = LexicalIndexBuilder() if build_lexical else None
+    # Códigos (CONT12, PROV2...) -> filas, para responderlos sin buscar vectores
+    codes = CodeIndex()
+    # Embeddings por tanda en index/checkpoint/ para poder retomar con --resume
+    ckpt = Checkpoint(checkpoint_dir(index_path), model_id, chunk_size, every=checkpoint_every, resume=resume)
+    rows = []
+    parts = []
+    n_missing = 0
+    try:
+        for b, batch in enumerate(_chunks(documents, chunk_size)):
+            texts = [d["text"] for d in batch]
+            with timer.stage("manifest"):
+                batch_rows = [manifest_row(d, t) for d, t in zip(batch, texts)]
+            with timer.stage("checkpoint"):
+                vectors = ckpt.get(b, batch_rows)
+            if vectors is None:
+                # Solo se calculan embeddings para textos que no estaban en la corrida anterior
+                with timer.stage("embedding"):
+                    src = np.array([reusable.get(r["hash"], -1) for r in batch_rows], dtype=np.int64)
+                    missing = np.flatnonzero(src < 0)
+                    reused = np.flatnonzero(src >= 0)
+                    new_vectors = cache.encode(model_id, [texts[i] for i in missing], encoder) if len(missing) else None
+                    dim = new_vectors.shape[1] if new_vectors is not None else old_vectors.shape[1]
+                    vectors = np.empty((len(batch), dim), dtype=np.float32)
+                    if new_vectors is not None:
+                        vectors[missing] = new_vectors
+                    if len(reused):
+                        vectors[reused] = old_vectors[src[reused]]
+                with timer.stage("checkpoint"):
+                    ckpt.add(b, batch_rows, vectors)
+                n_missing += len(missing)
+            parts.append(vectors)
+            rows.extend(batch_rows)
+            if lexicon is not None:
+                with timer.stage("lexical"):
+                    lexicon.add(texts)
+            with timer.stage("codes"):
+                for i, text in enumerate(texts, len(rows) - len(batch)):
+                    codes.add(i, text)
+            with timer.stage("metadata"):
+                for d in batch:
+                    record = {"metadata": d["metadata"], "text": d["text"]}
+                    writer.add(record)
+                    if json_store is not None:
+                        json_store.append(record)
+            if len(rows) > len(batch):
+                print(f"  Filas procesadas: {len(rows)}")
+    except BaseException:
+        writer.close()
+        snapshot.abort()
+        # Lo calculado hasta acá queda en el checkpoint
+        ckpt.flush()
+        raise
+    finally:
+        encoder.close()
+    if not rows:
+        writer.close()
+        snapshot.abort()
+        ckpt.clear()
+        print("No hay documentos para indexar.")
+        return
+    old_vectors = reusable = None
+    try:
+        version = _write_snapshot(snapshot, out_index, writer, rows, parts, old_rows, n_missing, cache, model_id,
+                                  chunker, near_dups, dedup_threshold, index_type, index_params, build_shards,
+                                  lexicon, codes, timer)
+    except BaseException:
+        snapshot.abort()
+        ckpt.flush()
+        raise
+    with timer.stage("checkpoint"):
+        ckpt.clear()
+    print(f"Versión {version} publicada en {os.path.join(index_dir, snapshots.SNAPSHOT_DIR)}")
+    if json_store is not None:
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(json_store, f, ensure_ascii=False, indent=2)
+        print(f"Copia JSON de los metadatos en {meta_path}")
+
+
+def _write_snapshot(snapshot, out_index, writer, rows, parts, old_rows, n_missing, cache, model_name,
+                    chunker, near_dups, dedup_threshold, index_type, index_params, build_shards, lexicon=None,
+                    codes=None, timer=None):
+    timer = timer or _NoTimer()
+    print(f"Documentos indexados: {len(chunker.doc_ids)}")
+    dups = {}
+    if near_dups is not None:
+        # near_dups cuenta representantes; con los chunks intercalados cambian los ids
+        with timer.stage("dedup"):
+            dups = {chunker.doc_ids[k]: v for k, v in near_dups.duplicates.items()}
+            near_dups.save(out_index, ids=chunker.doc_ids)
+        kind = f"casi duplicadas (umbral {dedup_threshold})" if dedup_threshold else "duplicadas"
+        print(f"Filas {kind} colapsadas: {near_dups.dropped}")
+    with timer.stage("chunking"):
+        chunker.save(out_index)
+    if chunker.chunks:
+        print(f"Filas largas partidas en ventanas: {chunker.chunks} vectores extra")
+    if old_rows is not None:
+        added, changed, removed = diff_manifest(old_rows, rows)
+        print(f"Filas nuevas: {added}, modificadas: {changed}, eliminadas: {removed}")
+    print(f"Embeddings reutilizados: {len(rows) - n_missing}, calculados o tomados del cache: {n_missing}")
+    if n_missing:
+        print(format_stats(cache.stats()))
+    embeddings = np.concatenate(parts) if len(parts) > 1 else parts[0]
+    parts.clear()
+
+    with timer.stage("index_build"):
+        index, params = faiss_index.build_index(embeddings, index_type, **(index_params or {}))
+        faiss_index.write_index(index, out_index, params)
+    print(f"Índice FAISS ({faiss_index.describe(params)}) con {index.ntotal} vectores")
+    if params["index_type"] in faiss_index.SCALAR_QUANTIZERS:
+        stored, full = faiss_index.memory_bytes(index, params)
+        print(f"  Vectores: {stored / 2**20:.1f} MB en vez de {full / 2**20:.1f} MB "
+              f"({100 * (1 - stored / max(full, 1)):.0f}% menos)")
+        with timer.stage("index_build"):
+            recall = faiss_index.recall_at_k(index, embeddings, k=10)
+            rescored = faiss_index.recall_at_k(index, embeddings, k=10, rescore_factor=params["rescore"])
+        print(f"  recall@10 contra flat: {recall:.3f} sin reordenar, {rescored:.3f} reordenando x{params['rescore']}")
+    with timer.stage("manifest"):
+        save_manifest(out_index, model_name, rows, embeddings)
+    if build_shards:
+        # Un vector colapsado va al shard de cada hoja donde aparece alguna de sus filas
+        with timer.stage("shards"):
+            sheet_sets = [[r["sheet"]] + [d["sheet"] for d in dups.get(chunker.parents[i], [])] for i, r in enumerate(rows)]
+            router = shards.build_shards(embeddings, sheet_sets, out_index, index_type, index_params)
+        print(f"Shards por hoja: {len(router['sheets'])}")
+    if lexicon is not None:
+        with timer.stage("lexical"):
+            terms = lexicon.save(out_index)
+        print(f"Índice léxico (BM25): {terms} términos")
+    if codes is not None:
+        with timer.stage("codes"):
+            count = codes.save(out_index)
+        print(f"Códigos exactos: {count}")
+    with timer.stage("publish"):
+        writer.close()
+        return snapshot.commit(info={"documents": len(chunker.doc_ids), "vectors": int(index.ntotal),
+                                     "model": model_name, "index_type": params["index_type"]})
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--excel", default=excel_path_default, help="ruta a tu archivo .xlsx")
+    parser.add_argument("--source", nargs="+",
+                        help="varias fuentes en vez de --excel: archivos, carpetas o globs de .xlsx, .csv y .parquet "
+                             "(ej. \"escuelas/*.xlsx\" exports/*.csv)")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="procesos para leer las fuentes en paralelo (0 = uno por núcleo)")
     parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=BACKENDS,
+                        help="torch, onnx u onnx-int8 (ver src/encoders.py); también por ENCODER_BACKEND")
     parser.add_argument("--index", default="index/faiss.index")
     parser.add_argument("--meta", default="index/metadata.json")
+    parser.add_argument("--stream", action="store_true",
+                        help="leer el Excel fila por fila (openpyxl read_only) en vez de cargarlo entero")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="documentos por tanda de embeddings")
+    parser.add_argument("--full", action="store_true", help="ignorar el manifiesto y recalcular todos los embeddings")
+    parser.add_argument("--resume", action="store_true",
+                        help="retomar una corrida cortada usando los embeddings guardados en index/checkpoint")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY,
+                        help="tandas entre escrituras del checkpoint; 0 desactiva")
+    parser.add_argument("--json-meta", action="store_true", help="escribir además metadata.json (más lento de leer)")
+    parser.add_argument("--batch-size", type=int, default=64, help="batch base; las filas cortas usan más, las largas menos")
+    parser.add_argument("--workers", type=int, default=0, help="procesos para los embeddings (0 = todos los núcleos si hay muchas filas)")
+    parser.add_argument("--no-shards", action="store_true", help="no generar un índice por hoja")
+    parser.add_argument("--no-lexical", action="store_true", help="no generar el índice BM25 (búsqueda híbrida)")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="colapsar también filas casi idénticas: similitud (Jaccard de bigramas) a partir de la cual "
+                             "se indexan una sola vez, p. ej. 0.9; por defecto solo las idénticas; 0 desactiva")
+    parser.add_argument("--chunk-words", type=int, default=CHUNK_WORDS,
+                        help="palabras por ventana para filas largas (el modelo corta en 256 word pieces); 0 desactiva")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="palabras compartidas entre ventanas")
+    parser.add_argument("--index-type", default="auto", choices=faiss_index.INDEX_TYPES,
+                        help="auto elige según la cantidad de filas (flat < 50k, hnsw < 1M, ivfpq); "
+                             "fp16/sq8 guardan los vectores cuantizados")
+    parser.add_argument("--nlist", type=int, help="centroides para ivf/ivfpq")
+    parser.add_argument("--nprobe", type=int, help="listas a recorrer por búsqueda en ivf/ivfpq")
+    parser.add_argument("--pq-m", type=int, help="sub-vectores para ivfpq (tiene que dividir la dimensión)")
+    parser.add_argument("--hnsw-m", type=int, help="vecinos por nodo en hnsw")
+    parser.add_argument("--ef-search", type=int, help="candidatos por búsqueda en hnsw")
+    parser.add_argument("--rescore", type=int,
+                        help="fp16/sq8: candidatos por resultado que se reordenan con los vectores float32")
     args = parser.parse_args()
 
-    if not os.path.exists(args.excel):
-        print("No encontré el archivo Excel en:", args.excel)
+    if args.source:
+        sources = expand_sources(args.source)
+        if not sources:
+            print("Ningún archivo .xlsx, .csv o .parquet coincide con:", " ".join(args.source))
+            exit(1)
+    else:
+        sources = [args.excel]
+    missing = [p for p in sources if not os.path.exists(p)]
+    if missing:
+        print("No encontré el archivo en:", ", ".join(missing))
         print("Asegurate de que el archivo exista y que la ruta sea correcta.")
         exit(1)
 
-    docs = build_documents_from_excel(args.excel)
-    print(f"Documentos extraídos: {len(docs)}")
-    index_documents(docs, model_name=args.model, index_path=args.index, meta_path=args.meta)
+    if len(sources) > 1 or args.stream:
+        print(f"Fuentes: {len(sources)} archivo{'s' if len(sources) > 1 else ''}")
+        docs = iter_documents_from_sources(sources, workers=args.parse_workers, stream=args.stream)
+    else:
+        docs = read_source(sources[0])
+        print(f"Documentos extraídos: {len(docs)}")
+    index_params = {"nlist": args.nlist, "nprobe": args.nprobe, "m": args.pq_m,
+                    "hnsw_m": args.hnsw_m, "ef_search": args.ef_search, "rescore": args.rescore}
+    index_documents(docs, model_name=args.model, index_path=args.index, meta_path=args.meta,
+                    incremental=not args.full, index_type=args.index_type, index_params=index_params,
+                    write_json=args.json_meta, batch_size=args.batch_size, workers=args.workers,
+                    chunk_size=args.chunk_size, build_shards=not args.no_shards,
+                    dedup_threshold=args.dedup_threshold, chunk_words=args.chunk_words,
+                    chunk_overlap=args.chunk_overlap, resume=args.resume,
+                    checkpoint_every=args.checkpoint_every, backend=args.backend,
+                    build_lexical=not args.no_lexical)
 
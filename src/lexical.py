@@ -0,0 +1,188 @@
+# src/lexical.py
+# Índice invertido BM25 sobre los mismos textos que FAISS (un documento por id de FAISS,
+# chunks incluidos). Sirve para códigos y términos literales ("CONT12", "Modalidad_Tipo")
+# que los embeddings rankean mal. Los términos se pliegan sin tildes y pasan por un
+# stemmer liviano de castellano; los códigos (letras con números o con _) quedan enteros.
+# Se guarda en lexical/ junto al índice: postings en .npy (se abren con mmap) y el
+# vocabulario en lexical.json.
+import os
+import re
+import json
+import shutil
+import unicodedata
+import numpy as np
+
+LEXICAL_DIR = "lexical"
+HEADER_FILE = "lexical.json"
+
+# Parámetros de BM25
+K1 = 1.2
+B = 0.75
+# Constante de reciprocal rank fusion (el 60 del paper original)
+RRF_K = 60
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:_[a-z0-9]+)*")
+
+STOPWORDS = set("""
+a al algo algun alguna algunas alguno algunos ante antes como con contra cual cuales cuando de del
+desde donde durante e el ella ellas ellos en entre era es esa esas ese eso esos esta estan estas este
+esto estos fue hay la las le les lo los mas me mi muy nada ni no nos o otra otras otro otros para
+pero poco por porque que quien quienes se sea ser si sin sobre son su sus tambien te todo todos tu
+un una uno unos y ya yo
+""".split())
+
+# Sufijos de más largo a más corto; se saca el primero que deje al menos 3 letras
+_SUFFIXES = sorted("""
+amientos imientos amiento imiento aciones iciones uciones acion icion ucion mente idades idad
+ismos ismo istas ista ables ibles able ible ados idos adas idas ado ido ada ida ales ores or
+es os as s o a e
+""".split(), key=len, reverse=True)
+
+
+def lexical_dir(index_path):
+    return os.path.join(os.path.dirname(index_path) or ".", LEXICAL_DIR)
+
+
+def fold(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def stem(word):
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    # "Modalidad_Tipo" da el término entero y sus partes, así también matchea "modalidad tipo"
+    tokens = []
+    for tok in _TOKEN.findall(fold(text)):
+        if "_" in tok:
+            tokens.append(tok)
+            tokens.extend(stem(p) for p in tok.split("_") if p not in STOPWORDS)
+        elif tok not in STOPWORDS:
+            tokens.append(stem(tok))
+    return tokens
+
+
+def is_code_query(query):
+    # Búsqueda literal: todas las palabras que no son stopwords parecen códigos.
+    # Misma definición de código que el índice exacto (codes importa este módulo)
+    from codes import is_code
+    words = [w.strip("¿?¡!.,;:\"'()") for w in query.split()]
+    words = [w for w in words if w and fold(w) not in STOPWORDS]
+    return bool(words) and len(words) <= 3 and all(is_code(w) for w in words)
+
+
+def rrf(rankings, top_k, k=RRF_K):
+    # Reciprocal rank fusion: cada lista suma 1 / (k + posición) a sus documentos
+    scores = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+
+class LexicalIndexBuilder:
+    # Se alimenta por tandas (como el indexer) y guarda las postings ordenadas por término
+    def __init__(self):
+        self.vocab = {}
+        self.n = 0
+        self._terms, self._docs, self._tfs = [], [], []
+        self._lengths = []
+
+    def add(self, texts):
+        terms, docs, tfs = [], [], []
+        for text in texts:
+            counts = {}
+            tokens = tokenize(text)
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                terms.append(self.vocab.setdefault(tok, len(self.vocab)))
+                docs.append(self.n)
+                tfs.append(tf)
+            self._lengths.append(len(tokens))
+            self.n += 1
+        self._terms.append(np.asarray(terms, dtype=np.int32))
+        self._docs.append(np.asarray(docs, dtype=np.int32))
+        self._tfs.append(np.asarray(tfs, dtype=np.uint16))
+
+    def save(self, index_path):
+        out_dir = lexical_dir(index_path)
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.makedirs(out_dir)
+        terms = np.concatenate(self._terms) if self._terms else np.empty(0, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.vocab)), out=offsets[1:])
+        np.save(os.path.join(out_dir, "docs.npy"), np.concatenate(self._docs)[order] if self._docs else terms)
+        np.save(os.path.join(out_dir, "tfs.npy"), np.concatenate(self._tfs)[order] if self._tfs else terms)
+        np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+        np.save(os.path.join(out_dir, "lengths.npy"), np.asarray(self._lengths, dtype=np.int32))
+        header = {"count": self.n, "k1": K1, "b": B, "terms": list(self.vocab)}
+        with open(os.path.join(out_dir, HEADER_FILE), "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False)
+        return len(self.vocab)
+
+
+def remove_lexical(index_path):
+    if os.path.exists(lexical_dir(index_path)):
+        shutil.rmtree(lexical_dir(index_path))
+
+
+def has_lexical(index_path):
+    return os.path.exists(os.path.join(lexical_dir(index_path), HEADER_FILE))
+
+
+class LexicalIndex:
+    # Los documentos agregados después de indexar (add: en el chat) solo se encuentran por vectores
+    def __init__(self, index_path):
+        path = lexical_dir(index_path)
+        with open(os.path.join(path, HEADER_FILE), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        self.n = header["count"]
+        self.k1, self.b = header["k1"], header["b"]
+        self.terms = {t: i for i, t in enumerate(header["terms"])}
+        self.docs = np.load(os.path.join(path, "docs.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        lengths = np.load(os.path.join(path, "lengths.npy")).astype(np.float32)
+        # Parte de BM25 que depende solo del largo de cada documento
+        self._norm = self.k1 * (1 - self.b + self.b * lengths / max(float(lengths.mean()) if self.n else 1.0, 1e-9))
+
+    def __len__(self):
+        return self.n
+
+    def scores(self, query):
+        scores = np.zeros(self.n, dtype=np.float32)
+        for tok in dict.fromkeys(tokenize(query)):
+            t = self.terms.get(tok)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs = np.asarray(self.docs[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            idf = np.log1p((self.n - len(docs) + 0.5) / (len(docs) + 0.5))
+            # Cada documento aparece una vez por término: se puede sumar sin np.add.at
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def search(self, query, k, ids=None):
+        # (puntajes, ids) de mayor a menor, solo documentos con algún término; ids restringe la búsqueda
+        scores = self.scores(query)
+        if ids is not None:
+            ids = np.asarray(ids, dtype=np.int64)
+            ids = ids[ids < self.n]
+            candidates = ids[scores[ids] > 0]
+        else:
+            candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = np.argsort(-scores[candidates], kind="stable")
+        return scores[candidates[order]], candidates[order]
@@ -0,0 +1,204 @@
+# src/meta_store.py
+# Metadatos en formato binario: cada registro es un JSON compacto dentro de un blob,
+# con un arreglo de offsets de ancho fijo (uint64) para ubicarlo por id de FAISS.
+# Offsets y blob se abren con mmap, así que solo se decodifican las filas que se piden.
+import os
+import sys
+import json
+import mmap
+import argparse
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def store_paths(meta_path):
+    base = meta_path[:-len(".json")] if meta_path.endswith(".json") else meta_path
+    return {
+        "header": base + ".store.json",
+        "offsets": base + ".offsets.npy",
+        "sheets": base + ".sheets.npy",
+        "blob": base + ".blob",
+    }
+
+
+def store_exists(meta_path):
+    return os.path.exists(store_paths(meta_path)["header"])
+
+
+def _encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class MetaStoreWriter:
+    # Escribe registro por registro, sin juntar todo en memoria
+    def __init__(self, meta_path):
+        self.paths = store_paths(meta_path)
+        if os.path.dirname(meta_path):
+            os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        self._blob = open(self.paths["blob"] + ".tmp", "wb")
+        self._offsets = [0]
+        self._sheet_codes = []
+        self._sheets = {}
+
+    def add(self, record):
+        data = _encode(record)
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+        sheet = str(record.get("metadata", {}).get("sheet", ""))
+        self._sheet_codes.append(self._sheets.setdefault(sheet, len(self._sheets)))
+
+    def close(self):
+        self._blob.close()
+        np.save(self.paths["offsets"] + ".tmp.npy", np.asarray(self._offsets, dtype=np.uint64))
+        np.save(self.paths["sheets"] + ".tmp.npy", np.asarray(self._sheet_codes, dtype=np.int32))
+        os.replace(self.paths["blob"] + ".tmp", self.paths["blob"])
+        os.replace(self.paths["offsets"] + ".tmp.npy", self.paths["offsets"])
+        os.replace(self.paths["sheets"] + ".tmp.npy", self.paths["sheets"])
+        header = {"format": FORMAT_VERSION, "count": len(self._offsets) - 1, "sheets": list(self._sheets)}
+        # El header va último: si existe, el resto ya está completo
+        with open(self.paths["header"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False)
+        os.replace(self.paths["header"] + ".tmp", self.paths["header"])
+
+
+def write_store(records, meta_path):
+    writer = MetaStoreWriter(meta_path)
+    for record in records:
+        writer.add(record)
+    writer.close()
+
+
+class MetaStore:
+    # Se comporta como la lista de metadata.json: len(), meta[i], iteración y append()
+    def __init__(self, meta_path):
+        self.meta_path = meta_path
+        self.paths = store_paths(meta_path)
+        self._pending = []
+        self._open()
+
+    def _open(self):
+        with open(self.paths["header"], "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Formato de metadatos no soportado: {header.get('format')}")
+        self.sheet_names = header["sheets"]
+        self._offsets = np.load(self.paths["offsets"], mmap_mode="r")
+        self._sheet_codes = np.load(self.paths["sheets"], mmap_mode="r")
+        self._file = open(self.paths["blob"], "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap no acepta archivos vacíos
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._stored = len(self._offsets) - 1
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+        self._offsets = None
+        self._sheet_codes = None
+
+    def __len__(self):
+        return self._stored + len(self._pending)
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if i >= self._stored:
+            return self._pending[i - self._stored]
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return json.loads(self._blob[start:end].decode("utf-8"))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sheet_codes(self):
+        # Código de hoja por registro (índice en sheet_names), sin decodificar los registros
+        codes = np.asarray(self._sheet_codes, dtype=np.int32)
+        if not self._pending:
+            return codes
+        extra = [self._sheet_code(r) for r in self._pending]
+        return np.concatenate([codes, np.asarray(extra, dtype=np.int32)])
+
+    def _sheet_code(self, record):
+        sheet = str(record.get("metadata", {}).get("sheet", ""))
+        if sheet not in self.sheet_names:
+            self.sheet_names.append(sheet)
+        return self.sheet_names.index(sheet)
+
+    def append(self, record):
+        self._pending.append(record)
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending = self._pending
+        offsets = np.asarray(self._offsets, dtype=np.uint64).tolist()
+        codes = np.asarray(self._sheet_codes, dtype=np.int32).tolist()
+        codes += [self._sheet_code(r) for r in pending]
+        sheet_names = list(self.sheet_names)
+        # En Windows no se puede reemplazar un archivo mapeado: se cierra antes de escribir
+        self.close()
+        with open(self.paths["blob"], "ab") as f:
+            for record in pending:
+                data = _encode(record)
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(self.paths["offsets"] + ".tmp.npy", np.asarray(offsets, dtype=np.uint64))
+        np.save(self.paths["sheets"] + ".tmp.npy", np.asarray(codes, dtype=np.int32))
+        os.replace(self.paths["offsets"] + ".tmp.npy", self.paths["offsets"])
+        os.replace(self.paths["sheets"] + ".tmp.npy", self.paths["sheets"])
+        header = {"format": FORMAT_VERSION, "count": len(offsets) - 1, "sheets": sheet_names}
+        with open(self.paths["header"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False)
+        os.replace(self.paths["header"] + ".tmp", self.paths["header"])
+        self._pending = []
+        self._open()
+
+
+def migrate_json(meta_path, json_path=None):
+    json_path = json_path or meta_path
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    write_store(records, meta_path)
+    return len(records)
+
+
+def open_meta(meta_path, migrate=False):
+    # Devuelve un MetaStore si existe; si solo está el metadata.json viejo, la lista (o lo migra)
+    if store_exists(meta_path):
+        return MetaStore(meta_path)
+    if os.path.exists(meta_path):
+        if not migrate:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        count = migrate_json(meta_path)
+        print(f"Metadatos migrados de {meta_path} al formato binario ({count} registros)")
+        return MetaStore(meta_path)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte metadata.json al formato binario con mmap")
+    parser.add_argument("--meta", default="index/metadata.json", help="metadata.json a migrar")
+    parser.add_argument("--check", action="store_true", help="comparar registro por registro después de migrar")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.meta):
+        print("No encontré el archivo de metadatos en:", args.meta)
+        sys.exit(1)
+    count = migrate_json(args.meta)
+    paths = store_paths(args.meta)
+    size = sum(os.path.getsize(p) for p in paths.values())
+    print(f"{count} registros migrados: {os.path.getsize(args.meta) / 1e6:.1f} MB de JSON -> {size / 1e6:.1f} MB")
+    if args.check:
+        with open(args.meta, "r", encoding="utf-8") as f:
+            original = json.load(f)
+        store = MetaStore(args.meta)
+        bad = sum(1 for i, rec in enumerate(original) if store[i] != rec)
+        store.close()
+        print("Verificación OK" if not bad else f"{bad} registros no coinciden")
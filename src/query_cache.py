@@ -0,0 +1,146 @@
+# src/query_cache.py
+# Cache semántico de consultas: guarda los resultados (y las respuestas de OpenAI) de las
+# consultas recientes junto con su embedding en un índice FAISS chico en memoria. Una
+# consulta nueva reutiliza lo guardado si se parece lo suficiente (coseno >= THRESHOLD)
+# a una anterior con el mismo alcance (hoja, top_k, modo). "contenidos segunda unidad
+# matematicas" y "matemática unidad 2 contenidos" comparten resultado.
+# Las entradas vencen a los TTL segundos, se descartan por LRU pasadas MAX_ENTRIES y
+# todo se vacía cuando cambia la versión del índice.
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+THRESHOLD = float(os.getenv("QUERY_CACHE_THRESHOLD", "0.92"))
+TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2000"))
+# Vecinos que se revisan por consulta (pueden tener otro alcance)
+SEARCH_K = 8
+
+_NUMBER = re.compile(r"\d+")
+# Ordinales escritos ("segunda unidad", "tercer año") cuentan como el número
+_ORDINAL = re.compile(r"\b(primer|segund|tercer|cuart|quint|sext|s[eé]ptim|octav|noven|d[eé]cim)(?:[oa]s?)?\b")
+_ORDINALS = {"primer": 1, "segund": 2, "tercer": 3, "cuart": 4, "quint": 5, "sext": 6, "septim": 7,
+             "octav": 8, "noven": 9, "decim": 10}
+
+
+def normalize_query(text):
+    return " ".join(str(text).lower().split())
+
+
+def _numbers(text):
+    found = {int(n) for n in _NUMBER.findall(text)}
+    found.update(_ORDINALS[stem.replace("é", "e")] for stem in _ORDINAL.findall(text))
+    return found
+
+
+class SemanticCache:
+    def __init__(self, threshold=THRESHOLD, ttl=TTL, max_entries=MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # id -> (alcance, consulta normalizada, valor, creado); en orden de uso (LRU)
+        self._entries = OrderedDict()
+        self._exact = {}
+        self._index = None
+        self._next_id = 0
+
+    def check_version(self, version):
+        with self._lock:
+            if version != self.version:
+                self.clear()
+                self.version = version
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _unit(self, embedding):
+        v = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def _drop(self, entry_id):
+        scope, text, _, _ = self._entries.pop(entry_id)
+        self._exact.pop((scope, text), None)
+        if self._index is not None:
+            self._index.remove_ids(np.asarray([entry_id], dtype=np.int64))
+
+    def _expired(self, created):
+        return self.ttl and time.time() - created > self.ttl
+
+    def get(self, query, scope, embedding=None):
+        # scope: tupla con todo lo que tiene que coincidir (tipo, hoja, top_k, modo...)
+        text = normalize_query(query)
+        with self._lock:
+            entry_id = self._exact.get((scope, text))
+            semantic = False
+            if entry_id is None and embedding is not None and self._index is not None and self._index.ntotal:
+                D, I = self._index.search(self._unit(embedding), min(SEARCH_K, self._index.ntotal))
+                numbers = _numbers(text)
+                for sim, i in zip(D[0], I[0]):
+                    if i < 0 or sim < self.threshold:
+                        break
+                    other_scope, other_text, _, _ = self._entries[int(i)]
+                    # "unidad 2" y "unidad 3" (o "segunda" y "tercera") se parecen mucho: tienen que tener
+                    # los mismos números, también cuando una no trae ninguno ("unidad" y "unidad 3")
+                    if other_scope == scope and numbers == _numbers(other_text):
+                        entry_id, semantic = int(i), True
+                        break
+            if entry_id is not None and self._expired(self._entries[entry_id][3]):
+                self._drop(entry_id)
+                entry_id = None
+            if entry_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            self.semantic_hits += semantic
+            return self._entries[entry_id][2]
+
+    def put(self, query, scope, value, embedding=None):
+        # Sin embedding la entrada solo se encuentra por texto exacto
+        text = normalize_query(query)
+        with self._lock:
+            old = self._exact.get((scope, text))
+            if old is not None:
+                self._drop(old)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, text, value, time.time())
+            self._exact[(scope, text)] = entry_id
+            if embedding is not None:
+                if self._index is None:
+                    import faiss
+                    dim = self._unit(embedding).shape[1]
+                    self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+                self._index.add_with_ids(self._unit(embedding), np.asarray([entry_id], dtype=np.int64))
+            self._evict()
+
+    def _evict(self):
+        # Primero las vencidas, después las usadas hace más tiempo
+        now = time.time()
+        if self.ttl:
+            for entry_id in [i for i, e in self._entries.items() if now - e[3] > self.ttl]:
+                self._drop(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "semantic_hits": self.semantic_hits,
+                "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "version": self.version}
+
+
+def format_stats(stats):
+    return (f"Cache de consultas: {stats['hits']} aciertos ({stats['semantic_hits']} por similitud), "
+            f"{stats['misses']} fallos ({stats['hit_rate']:.0%}), {stats['entries']} entradas")
@@ -0,0 +1,94 @@
+# src/retrieval_client.py
+# Cliente del servicio de búsqueda (src/retrieval_server.py). Solo usa la biblioteca
+# estándar: un proceso que le pregunta al servicio no carga modelo, FAISS ni metadatos.
+# La dirección es host:puerto o unix:/ruta/al.socket (por defecto RETRIEVAL_SERVER).
+import os
+import json
+import socket
+import threading
+import http.client
+
+DEFAULT_ADDRESS = os.getenv("RETRIEVAL_SERVER", "127.0.0.1:8765")
+# Timeout del chequeo de si el servicio está levantado; las búsquedas esperan más
+PROBE_TIMEOUT = 0.3
+TIMEOUT = 30.0
+
+
+class RetrievalServerError(Exception):
+    pass
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def _connection(address, timeout):
+    if address.startswith("unix:"):
+        return _UnixConnection(address[len("unix:"):], timeout)
+    host, _, port = address.rpartition(":")
+    return http.client.HTTPConnection(host or "127.0.0.1", int(port), timeout=timeout)
+
+
+class RetrievalClient:
+    # Una conexión keep-alive por hilo
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _request(self, method, path, payload=None, timeout=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = _connection(self.address, timeout or self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = json.loads(resp.read() or b"null")
+                break
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                # El servidor pudo cerrar la conexión keep-alive: se reintenta una vez con una nueva
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise RetrievalServerError(f"{self.address} no responde: {e}") from e
+        if resp.status != 200:
+            raise RetrievalServerError(f"{method} {path}: {resp.status} {data.get('error') if data else ''}")
+        return data
+
+    def health(self, timeout=None):
+        return self._request("GET", "/health", timeout=timeout)
+
+    def search(self, query, top_k=4, sheet_filter=None, mode=None, collapse="max"):
+        return self._request("POST", "/search", {"query": query, "top_k": top_k, "sheet": sheet_filter,
+                                                 "mode": mode, "collapse": collapse})["results"]
+
+    def search_batch(self, queries, top_k=4, sheet_filters=None, mode=None, collapse="max"):
+        return self._request("POST", "/search_batch", {"queries": list(queries), "top_k": top_k,
+                                                       "sheets": sheet_filters, "mode": mode,
+                                                       "collapse": collapse})["results"]
+
+    def doc(self, doc_id):
+        return self._request("GET", f"/doc/{int(doc_id)}")
+
+
+def find_server(address=DEFAULT_ADDRESS):
+    # Cliente si el servicio responde, None si no está corriendo
+    if not address or address.lower() == "off":
+        return None
+    client = RetrievalClient(address)
+    try:
+        client.health(timeout=PROBE_TIMEOUT)
+    except (ValueError, RetrievalServerError):
+        return None
+    client._local.conn = None
+    return client
@@ -0,0 +1,192 @@
+# src/retrieval_server.py
+# Servicio de búsqueda de larga vida: un solo proceso con el modelo, el índice y los
+# metadatos cargados, que atienden el chat y los scripts por HTTP en localhost (o por un
+# socket Unix). Cada cliente se ahorra el arranque y la RAM de su propia copia.
+#
+#   python src/retrieval_server.py                          # 127.0.0.1:8765
+#   python src/retrieval_server.py --address unix:/tmp/bot_profesores.sock
+#
+# Endpoints (JSON):
+#   GET  /health                 versión del índice y cantidad de documentos
+#   POST /search                 {"query", "top_k", "sheet", "mode", "collapse"} -> {"results": [...]}
+#   POST /search_batch           {"queries": [...], "top_k", "sheets", "mode", "collapse"} -> {"results": [[...], ...]}
+#   GET  /doc/{id}               registro de metadatos del id de FAISS
+# Las versiones nuevas que publica el indexer se toman solas (snapshots.SnapshotWatcher).
+# Las /search que llegan juntas se agrupan en un solo retrieve_many (src/batcher.py).
+import os
+import json
+import argparse
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import chat_incremental as chat
+from retrieval_client import DEFAULT_ADDRESS
+from batcher import MicroBatcher, BatcherThread, MAX_BATCH, MAX_WAIT_MS
+
+# Límite de consultas por /search_batch
+MAX_BATCH_QUERIES = 1024
+
+
+class RetrievalHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "BotProfesoresRetrieval/1.0"
+
+    def address_string(self):
+        # Por socket Unix no hay dirección del cliente
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            snapshot = chat.get_snapshot()
+            self._send(200, {"status": "ok", "version": snapshot.version,
+                             "documents": len(snapshot.meta) if snapshot.meta is not None else 0,
+                             "vectors": int(snapshot.index.ntotal) if snapshot.index is not None else 0})
+        elif self.path.startswith("/doc/"):
+            snapshot = chat.get_snapshot()
+            meta = snapshot.meta
+            try:
+                doc_id = int(self.path[len("/doc/"):])
+            except ValueError:
+                return self._send(400, {"error": "el id tiene que ser un número"})
+            if meta is None or not 0 <= doc_id < len(meta):
+                return self._send(404, {"error": f"no existe el documento {doc_id}"})
+            self._send(200, chat.with_duplicates(doc_id, meta[doc_id], snapshot.duplicates))
+        else:
+            self._send(404, {"error": f"ruta desconocida: {self.path}"})
+
+    def do_POST(self):
+        try:
+            body = self._body()
+            if not isinstance(body, dict):
+                raise TypeError("el cuerpo tiene que ser un objeto JSON")
+            top_k = body.get("top_k")
+            top_k = 4 if top_k is None else top_k
+            if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+                raise ValueError(f"top_k tiene que ser un entero positivo, no {top_k!r}")
+            mode = body.get("mode")
+            if mode is not None and mode not in chat.RETRIEVAL_MODES:
+                raise ValueError(f"mode tiene que ser uno de {', '.join(chat.RETRIEVAL_MODES)}")
+            collapse = body.get("collapse")
+            collapse = "max" if collapse is None else collapse
+            if collapse not in chat.COLLAPSE_MODES:
+                raise ValueError(f"collapse tiene que ser uno de {', '.join(chat.COLLAPSE_MODES)}")
+            if self.path == "/search":
+                queries, sheets = [str(body["query"])], [body.get("sheet")]
+            elif self.path == "/search_batch":
+                if not isinstance(body["queries"], list):
+                    raise TypeError("queries tiene que ser una lista")
+                queries, sheets = [str(q) for q in body["queries"]], body.get("sheets")
+                if len(queries) > MAX_BATCH_QUERIES:
+                    return self._send(413, {"error": f"más de {MAX_BATCH_QUERIES} consultas por pedido"})
+                # Una hoja para todas o una por consulta
+                if sheets is not None and not isinstance(sheets, (str, list)):
+                    raise TypeError("sheets tiene que ser una hoja o una lista de hojas")
+                if isinstance(sheets, list) and len(sheets) != len(queries):
+                    raise ValueError(f"sheets tiene {len(sheets)} elementos y queries {len(queries)}")
+            else:
+                return self._send(404, {"error": f"ruta desconocida: {self.path}"})
+            for sheet in sheets if isinstance(sheets, list) else [sheets]:
+                if sheet is not None and not isinstance(sheet, str):
+                    raise TypeError(f"cada hoja tiene que ser un texto o null, no {sheet!r}")
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send(400, {"error": f"pedido inválido: {e}"})
+        try:
+            if self.server.batcher is not None and self.path == "/search":
+                results = [self.server.batcher.search(queries[0], top_k, sheets[0], mode, collapse)]
+            else:
+                results = search_many(queries, top_k, sheets, mode, collapse)
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        except Exception as e:
+            return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+        self._send(200, {"results": results[0] if self.path == "/search" else results})
+
+
+def search_many(queries, top_k, sheet_filters, mode, collapse="max"):
+    # Toda la tanda con una misma versión del índice, aunque el indexer publique otra en el medio
+    return chat.retrieve_many(queries, chat.get_snapshot(), top_k=top_k, sheet_filters=sheet_filters,
+                              collapse=collapse, mode=mode)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+
+
+def make_server(address=DEFAULT_ADDRESS, verbose=False, batch_max=MAX_BATCH, batch_wait_ms=MAX_WAIT_MS):
+    if address.startswith("unix:"):
+        server = UnixHTTPServer(address[len("unix:"):], RetrievalHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), RetrievalHandler)
+        server.daemon_threads = True
+    server.verbose = verbose
+    # batch_max 1 desactiva el micro-batching: cada /search hace su propio retrieve_many
+    server.batcher = BatcherThread(MicroBatcher(search_many, batch_max, batch_wait_ms)) if batch_max > 1 else None
+    return server
+
+
+def serve(address=DEFAULT_ADDRESS, verbose=False, batch_max=MAX_BATCH, batch_wait_ms=MAX_WAIT_MS):
+    # Este proceso es el servicio: sus búsquedas son locales
+    chat.RETRIEVAL_SERVER = "off"
+    print("Cargando modelo e índice...")
+    snapshot = chat.get_snapshot()
+    chat.get_model().encode(["calentamiento"], convert_to_numpy=True)
+    print(f"Listo: {len(snapshot.meta) if snapshot.meta is not None else 0} documentos, versión {snapshot.version}")
+    server = make_server(address, verbose, batch_max, batch_wait_ms)
+    batching = f"tandas de hasta {batch_max} consultas o {batch_wait_ms:g} ms" if server.batcher else "sin micro-batching"
+    print(f"Escuchando en {address}, {batching} (Ctrl+C para salir)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Chau.")
+    finally:
+        server.server_close()
+        if server.batcher is not None:
+            print("Micro-batching:", server.batcher.batcher.stats())
+            server.batcher.close()
+        if address.startswith("unix:") and os.path.exists(address[len("unix:"):]):
+            os.remove(address[len("unix:"):])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio local de búsqueda compartido por el chat y los scripts")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS,
+                        help="host:puerto o unix:/ruta.sock (también por RETRIEVAL_SERVER)")
+    parser.add_argument("--backend", choices=["torch", "onnx", "onnx-int8"], default=chat.ENCODER_BACKEND,
+                        help="backend para los embeddings de las consultas")
+    parser.add_argument("--mode", choices=chat.RETRIEVAL_MODES, default=chat.RETRIEVAL_MODE,
+                        help="modo por defecto cuando el pedido no trae uno")
+    parser.add_argument("--batch-max", type=int, default=MAX_BATCH,
+                        help="consultas por tanda de micro-batching; 1 lo desactiva (también BATCH_MAX_SIZE)")
+    parser.add_argument("--batch-wait-ms", type=float, default=MAX_WAIT_MS,
+                        help="cuánto se espera a que se junten consultas (también BATCH_MAX_WAIT_MS)")
+    parser.add_argument("--mmap", action="store_true",
+                        help="abrir el índice con mmap, compartido con otros procesos (también FAISS_MMAP=1)")
+    parser.add_argument("--verbose", action="store_true", help="loguear cada pedido")
+    args = parser.parse_args()
+    if args.mmap:
+        os.environ["FAISS_MMAP"] = "1"
+    chat.ENCODER_BACKEND = args.backend
+    chat.RETRIEVAL_MODE = args.mode
+    serve(args.address, args.verbose, args.batch_max, args.batch_wait_ms)
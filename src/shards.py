@@ -0,0 +1,143 @@
+# src/shards.py
+# Un índice FAISS por hoja más un router (shards/router.json). Una consulta con
+# sheet:NOMBRE busca solo en el índice de esa hoja; sin filtro se buscan todas y se
+# combinan los resultados con un heap.
+import os
+import re
+import json
+import heapq
+import shutil
+import hashlib
+import numpy as np
+import faiss
+import faiss_index
+
+ROUTER_FILE = "router.json"
+
+# Hojas chicas van siempre en flat: IVF/PQ no se pueden entrenar con pocas filas
+MIN_ANN_ROWS = 10_000
+
+
+def shard_dir(index_path):
+    return os.path.join(os.path.dirname(index_path) or ".", "shards")
+
+
+def _shard_name(sheet):
+    # Nombre de archivo seguro y único aunque dos hojas difieran solo en símbolos
+    safe = re.sub(r"[^\w\-]", "_", sheet)[:40]
+    return f"{safe}_{hashlib.sha1(sheet.encode('utf-8')).hexdigest()[:8]}"
+
+
+def build_shards(embeddings, sheets, index_path, index_type="auto", index_params=None):
+    # sheets[i] es la hoja (o lista de hojas) del vector i; cada shard guarda los ids
+    # globales de sus vectores
+    out_dir = shard_dir(index_path)
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    members = {}
+    for i, entry in enumerate(sheets):
+        for sheet in dict.fromkeys([entry] if isinstance(entry, str) else entry):
+            members.setdefault(sheet, []).append(i)
+    router = {"sheets": {}}
+    for sheet, positions in members.items():
+        ids = np.asarray(positions, dtype=np.int64)
+        kind = index_type if len(ids) >= MIN_ANN_ROWS else "flat"
+        index, params = faiss_index.build_index(embeddings[ids], kind, **(index_params or {}))
+        name = _shard_name(sheet)
+        faiss_index.write_index(index, os.path.join(out_dir, name + ".index"), params)
+        np.save(os.path.join(out_dir, name + ".ids.npy"), ids)
+        router["sheets"][sheet] = {"name": name, "count": int(len(ids)), "index_type": params["index_type"]}
+    with open(os.path.join(out_dir, ROUTER_FILE), "w", encoding="utf-8") as f:
+        json.dump(router, f, ensure_ascii=False, indent=2)
+    return router
+
+
+def remove_shards(index_path):
+    if os.path.exists(shard_dir(index_path)):
+        shutil.rmtree(shard_dir(index_path))
+
+
+def has_shards(index_path):
+    return os.path.exists(os.path.join(shard_dir(index_path), ROUTER_FILE))
+
+
+class ShardRouter:
+    def __init__(self, index_path):
+        self.dir = shard_dir(index_path)
+        with open(os.path.join(self.dir, ROUTER_FILE), "r", encoding="utf-8") as f:
+            self.router = json.load(f)
+        self._by_lower = {s.lower(): s for s in self.router["sheets"]}
+        # Los shards se cargan recién la primera vez que se consultan
+        self._loaded = {}
+
+    def sheets(self):
+        return list(self.router["sheets"])
+
+    def match(self, sheet_filter):
+        return self._by_lower.get(sheet_filter.lower()) if sheet_filter else None
+
+    def _shard(self, sheet):
+        if sheet not in self._loaded:
+            name = self.router["sheets"][sheet]["name"]
+            index, _ = faiss_index.load_index(os.path.join(self.dir, name + ".index"))
+            ids = np.load(os.path.join(self.dir, name + ".ids.npy"))
+            self._loaded[sheet] = (index, ids)
+        return self._loaded[sheet]
+
+    def _search_shard(self, sheet, q_emb, k):
+        index, ids = self._shard(sheet)
+        if index.ntotal == 0:
+            return np.empty((len(q_emb), 0), dtype=np.float32), np.empty((len(q_emb), 0), dtype=np.int64)
+        D, I = index.search(q_emb, min(k, index.ntotal))
+        # ids locales del shard -> ids globales (los -1 de FAISS se mantienen)
+        G = np.where(I >= 0, ids[np.clip(I, 0, None)], -1)
+        return D, G
+
+    def search(self, q_emb, k, sheet=None):
+        # Misma forma que index.search: (D, I) de (n_consultas, k) con -1 de relleno
+        q_emb = np.ascontiguousarray(q_emb, dtype=np.float32)
+        nq = q_emb.shape[0]
+        D_out = np.full((nq, k), np.inf, dtype=np.float32)
+        I_out = np.full((nq, k), -1, dtype=np.int64)
+        if sheet is not None:
+            canonical = self.match(sheet)
+            if canonical is None:
+                return D_out, I_out
+            D, I = self._search_shard(canonical, q_emb, k)
+            D_out[:, :D.shape[1]] = D
+            I_out[:, :I.shape[1]] = I
+            return D_out, I_out
+
+        per_shard = [self._search_shard(s, q_emb, k) for s in self.router["sheets"]]
+        for q in range(nq):
+            candidates = ((d, i) for D, I in per_shard for d, i in zip(D[q], I[q]) if i >= 0)
+            best = heapq.nsmallest(k, candidates)
+            for rank, (d, i) in enumerate(best):
+                D_out[q, rank] = d
+                I_out[q, rank] = i
+        return D_out, I_out
+
+    def add(self, sheet, emb, global_id):
+        # Altas manuales (chat_incremental add:): al shard de la hoja, creándolo si no existe
+        canonical = self.match(sheet) or sheet
+        if canonical not in self.router["sheets"]:
+            name = _shard_name(canonical)
+            index = faiss.IndexFlatL2(emb.shape[1])
+            faiss_index.write_index(index, os.path.join(self.dir, name + ".index"), {"index_type": "flat"})
+            np.save(os.path.join(self.dir, name + ".ids.npy"), np.empty(0, dtype=np.int64))
+            self.router["sheets"][canonical] = {"name": name, "count": 0, "index_type": "flat"}
+            self._by_lower[canonical.lower()] = canonical
+        name = self.router["sheets"][canonical]["name"]
+        index, ids = self._shard(canonical)
+        if faiss_index.mmap_enabled():
+            # Un shard mapeado es de solo lectura: se agrega sobre una copia en memoria
+            index, _ = faiss_index.load_index(os.path.join(self.dir, name + ".index"), mmap=False)
+        index.add(np.ascontiguousarray(emb, dtype=np.float32))
+        ids = np.append(ids, np.int64(global_id))
+        self._loaded[canonical] = (index, ids)
+        faiss_index.write_index(index, os.path.join(self.dir, name + ".index"))
+        np.save(os.path.join(self.dir, name + ".ids.npy"), ids)
+        self.router["sheets"][canonical]["count"] = int(len(ids))
+        with open(os.path.join(self.dir, ROUTER_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.router, f, ensure_ascii=False, indent=2)
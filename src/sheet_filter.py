@@ -0,0 +1,120 @@
+# src/sheet_filter.py
+# Búsqueda filtrada por hoja sin traer de más y descartar: al cargar el índice se arma,
+# para cada hoja, la lista de ids que le pertenecen (incluye chunks y filas colapsadas
+# por el dedup). Las hojas chicas se buscan exacto con NumPy sobre sus vectores; las
+# grandes con un IDSelectorBitmap de FAISS, así el índice solo devuelve ids de esa hoja.
+import numpy as np
+import faiss
+
+# Hasta esta cantidad de filas la búsqueda exacta con NumPy es más rápida que el índice
+EXACT_MAX_ROWS = 4096
+
+
+def _empty(nq, k):
+    return np.full((nq, k), np.inf, dtype=np.float32), np.full((nq, k), -1, dtype=np.int64)
+
+
+class SheetFilter:
+    def __init__(self, meta, duplicates=None, parents=None, vectors=None):
+        # meta: MetaStore (con sheet_codes) o la lista vieja de metadata.json
+        if hasattr(meta, "sheet_codes"):
+            codes = meta.sheet_codes()
+            names = [str(s).lower() for s in meta.sheet_names]
+        else:
+            lowered = [str(r["metadata"].get("sheet", "")).lower() for r in meta]
+            names = list(dict.fromkeys(lowered))
+            position = {name: c for c, name in enumerate(names)}
+            codes = np.fromiter((position[s] for s in lowered), dtype=np.int32, count=len(lowered))
+        self.n = len(codes)
+        self.vectors = vectors
+        # id -> documento padre (los chunks heredan las hojas de los duplicados de su padre)
+        parent = np.arange(self.n, dtype=np.int64)
+        if parents is not None:
+            parent[:len(parents)] = np.asarray(parents)[:self.n]
+        extra = {}
+        for pid, dups in (duplicates or {}).items():
+            for d in dups:
+                extra.setdefault(str(d["sheet"]).lower(), set()).add(int(pid))
+        self._ids = {}
+        for code, name in enumerate(names):
+            mask = codes == code
+            if name in extra:
+                mask |= np.isin(parent, list(extra.pop(name)))
+            if name in self._ids:
+                # Dos hojas que difieren en mayúsculas se filtran juntas
+                mask[self._ids[name]] = True
+            self._ids[name] = np.flatnonzero(mask)
+        for name, pids in extra.items():
+            self._ids[name] = np.flatnonzero(np.isin(parent, list(pids)))
+        self._selectors = {}
+
+    def ids(self, sheet):
+        return self._ids.get(sheet.lower(), np.empty(0, dtype=np.int64))
+
+    def count(self, sheet):
+        return len(self.ids(sheet))
+
+    def _selector(self, sheet, n):
+        key = (sheet.lower(), n)
+        if key not in self._selectors:
+            mask = np.zeros(n, dtype=bool)
+            ids = self.ids(sheet)
+            mask[ids[ids < n]] = True
+            bits = np.packbits(mask, bitorder="little")
+            # Se guarda el arreglo junto al selector: FAISS solo tiene un puntero a él
+            self._selectors[key] = (bits, faiss.IDSelectorBitmap(n, faiss.swig_ptr(bits)))
+        return self._selectors[key][1]
+
+    def _search_params(self, index, selector):
+        # Los SearchParameters reemplazan a nprobe/efSearch del índice: se copian
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+        if hnsw is not None:
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.efSearch)
+        return faiss.SearchParameters(sel=selector)
+
+    def _vectors_of(self, index, ids):
+        # float32 de embeddings.npy; los ids agregados después (chat add:) se leen del índice
+        if self.vectors is None:
+            return np.vstack([index.reconstruct(int(i)) for i in ids]) if len(ids) else None
+        inside = ids < len(self.vectors)
+        out = np.empty((len(ids), self.vectors.shape[1]), dtype=np.float32)
+        out[inside] = self.vectors[ids[inside]]
+        for j in np.flatnonzero(~inside):
+            out[j] = index.reconstruct(int(ids[j]))
+        return out
+
+    def _exact(self, index, q_emb, k, ids):
+        vecs = self._vectors_of(index, ids)
+        d = (q_emb ** 2).sum(axis=1)[:, None] - 2 * q_emb @ vecs.T + (vecs ** 2).sum(axis=1)[None, :]
+        D, I = _empty(len(q_emb), k)
+        kk = min(k, len(ids))
+        top = np.argpartition(d, kk - 1, axis=1)[:, :kk] if kk < len(ids) else np.tile(np.arange(len(ids)), (len(q_emb), 1))
+        order = np.take_along_axis(d, top, axis=1).argsort(axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        D[:, :kk] = np.maximum(np.take_along_axis(d, top, axis=1), 0)
+        I[:, :kk] = ids[top]
+        return D, I
+
+    def search(self, index, q_emb, k, sheet):
+        # Misma forma que index.search, pero solo con ids de la hoja
+        q_emb = np.ascontiguousarray(q_emb, dtype=np.float32)
+        ids = self.ids(sheet)
+        ids = ids[ids < index.ntotal]
+        if not len(ids):
+            return _empty(len(q_emb), k)
+        if len(ids) <= EXACT_MAX_ROWS or not isinstance(index, faiss.Index):
+            try:
+                return self._exact(index, q_emb, k, ids)
+            except RuntimeError:
+                # Índices sin reconstruct (IVF sin direct map) y sin embeddings.npy
+                if not isinstance(index, faiss.Index):
+                    raise
+        D, I = index.search(q_emb, k, params=self._search_params(index, self._selector(sheet, index.ntotal)))
+        want = min(k, len(ids))
+        if (I >= 0).sum(axis=1).min() < want and len(ids) <= 4 * EXACT_MAX_ROWS:
+            # Con un filtro muy selectivo, IVF (pocas listas) o HNSW pueden quedarse cortos: exacto
+            return self._exact(index, q_emb, k, ids)
+        return D, I
@@ -0,0 +1,162 @@
+# src/snapshots.py
+# Versiones del índice: cada corrida escribe en index/snapshots/.tmp-*, renombra la
+# carpeta a vNNNNNN y recién entonces apunta index/CURRENT a ella (os.replace es
+# atómico). Un lector nunca ve un faiss.index nuevo con metadatos viejos.
+import os
+import re
+import json
+import time
+import shutil
+import threading
+
+SNAPSHOT_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "snapshot.json"
+KEEP_SNAPSHOTS = 3
+
+# Archivos que viven en index/ y no forman parte de una versión
+SHARED_PREFIXES = ("query_log.csv", "embedding_cache.sqlite", "checkpoint", CURRENT_FILE, SNAPSHOT_DIR)
+
+_VERSION = re.compile(r"^v(\d+)$")
+
+
+def current_version(index_dir):
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if name and os.path.isdir(os.path.join(index_dir, SNAPSHOT_DIR, name)) else None
+
+
+def current_dir(index_dir):
+    # Sin CURRENT (índices de antes de las versiones) los archivos están sueltos en index/
+    version = current_version(index_dir)
+    return os.path.join(index_dir, SNAPSHOT_DIR, version) if version else index_dir
+
+
+def resolve(path):
+    # "index/faiss.index" -> "index/snapshots/v000003/faiss.index"
+    index_dir = os.path.dirname(path) or "."
+    return os.path.join(current_dir(index_dir), os.path.basename(path))
+
+
+def read_manifest(snapshot_dir):
+    path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _versions(index_dir):
+    root = os.path.join(index_dir, SNAPSHOT_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(m.group(1)) for m in map(_VERSION.match, os.listdir(root)) if m)
+
+
+class SnapshotWriter:
+    # writer.path("faiss.index") da la ruta dentro de la versión en preparación
+    def __init__(self, index_dir, copy_from=None, skip=()):
+        self.index_dir = index_dir
+        root = os.path.join(index_dir, SNAPSHOT_DIR)
+        os.makedirs(root, exist_ok=True)
+        self.tmp_dir = os.path.join(root, f".tmp-{os.getpid()}-{time.time_ns()}")
+        if copy_from:
+            # Versión nueva a partir de otra (altas manuales): se copia todo lo versionado
+            shutil.copytree(copy_from, self.tmp_dir, ignore=lambda d, names: [
+                n for n in names if d == copy_from and (n.startswith(SHARED_PREFIXES) or n in skip or n == MANIFEST_FILE)])
+        else:
+            os.makedirs(self.tmp_dir)
+        self.version = None
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def commit(self, info=None):
+        root = os.path.join(self.index_dir, SNAPSHOT_DIR)
+        files = sorted(os.path.relpath(os.path.join(d, f), self.tmp_dir)
+                       for d, _, names in os.walk(self.tmp_dir) for f in names)
+        while True:
+            number = (_versions(self.index_dir) or [0])[-1] + 1
+            name = f"v{number:06d}"
+            manifest = {"version": name, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": files, **(info or {})}
+            with open(self.path(MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            try:
+                os.rename(self.tmp_dir, os.path.join(root, name))
+                break
+            except OSError:
+                # Otro proceso publicó la misma versión al mismo tiempo: se prueba la siguiente
+                if not os.path.exists(os.path.join(root, name)):
+                    raise
+        pointer = os.path.join(self.index_dir, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(self.index_dir, CURRENT_FILE))
+        self.version = name
+        prune(self.index_dir)
+        return name
+
+    def abort(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def prune(index_dir, keep=KEEP_SNAPSHOTS):
+    # En Windows una versión mapeada por otro proceso no se puede borrar: queda para la próxima
+    current = current_version(index_dir)
+    for number in _versions(index_dir)[:-keep]:
+        name = f"v{number:06d}"
+        if name != current:
+            shutil.rmtree(os.path.join(index_dir, SNAPSHOT_DIR, name), ignore_errors=True)
+
+
+class SnapshotWatcher:
+    # Mantiene cargada la versión actual. get() mira CURRENT cada check_interval segundos;
+    # si cambió, carga la nueva en un hilo aparte y la cambia cuando está lista, mientras
+    # tanto se sigue respondiendo con la anterior.
+    def __init__(self, index_dir, loader, check_interval=1.0):
+        self.index_dir = index_dir
+        self.loader = loader
+        self.check_interval = check_interval
+        self.version = None
+        self.value = None
+        self._last_check = 0.0
+        self._loading = None
+        self._lock = threading.Lock()
+
+    def _load(self, version):
+        value = self.loader(os.path.join(self.index_dir, SNAPSHOT_DIR, version) if version else self.index_dir)
+        with self._lock:
+            self.version, self.value = version, value
+            self._loading = None
+
+    def _load_in_background(self, version):
+        try:
+            self._load(version)
+        except Exception as e:
+            print(f"No se pudo cargar la versión {version} del índice: {e}")
+            with self._lock:
+                self._loading = None
+
+    def get(self):
+        now = time.monotonic()
+        if self.value is None:
+            self.refresh()
+        elif now - self._last_check >= self.check_interval:
+            self._last_check = now
+            version = current_version(self.index_dir)
+            with self._lock:
+                start = version != self.version and self._loading != version
+                if start:
+                    self._loading = version
+            if start:
+                threading.Thread(target=self._load_in_background, args=(version,), daemon=True).start()
+        return self.value
+
+    def refresh(self):
+        # Carga sincrónica (primer uso o después de publicar una versión propia)
+        self._last_check = time.monotonic()
+        self._load(current_version(self.index_dir))
+        return self.value
@@ -0,0 +1,189 @@
+# src/sources.py
+# Lectura de las fuentes que se indexan: libros .xlsx, exportaciones .csv (las de
+# sheet_export_csv_url) y .parquet. Con varias fuentes cada archivo se parsea en un
+# proceso aparte y los documentos salen en el orden de los archivos, para que el
+# indexer (dedup, manifiesto, checkpoint) vea siempre la misma secuencia.
+import os
+import glob
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+SOURCE_EXTENSIONS = EXCEL_EXTENSIONS + (".csv", ".parquet")
+
+
+def _column_as_text(series):
+    # Igual que str(valor).strip() celda por celda, pero por columna entera
+    if series.dtype.kind in "Mm":
+        # astype(str) recorta las fechas sin hora; str(Timestamp) no
+        return series.map(str).str.strip()
+    return series.astype(str).str.strip()
+
+
+def build_documents_from_frame(sheet_name, df):
+    df = df.fillna("")
+    if len(df.columns) and all(dt.kind in "biuf" for dt in df.dtypes):
+        # iterrows promovía las filas 100% numéricas a un dtype común (int -> float)
+        df = df.astype(df.to_numpy().dtype)
+    # Cada celda no vacía aporta "col: valor\n"; el strip final saca el último salto
+    text = np.full(len(df), "", dtype=object)
+    for col in df.columns:
+        val = _column_as_text(df[col])
+        part = (f"{col}: " + val + "\n").to_numpy(dtype=object)
+        text = text + np.where((val != "").to_numpy(), part, "")
+    text = pd.Series(text, index=df.index, dtype=object).str.strip()
+    keep = (text != "").to_numpy()
+    documents = []
+    for idx, t in zip(df.index[keep], text[keep]):
+        documents.append({
+            "text": t,
+            "metadata": {
+                "sheet": sheet_name,
+                "row_index": int(idx)
+            }
+        })
+    return documents
+
+
+def build_documents_from_frames(sheets):
+    documents = []
+    for sheet_name, df in sheets.items():
+        documents.extend(build_documents_from_frame(sheet_name, df))
+    return documents
+
+
+def build_documents_from_excel(excel_path):
+    sheets = pd.read_excel(excel_path, sheet_name=None)
+    return build_documents_from_frames(sheets)
+
+
+def _header_names(values):
+    # Mismos nombres que pone pandas: "Unnamed: i" para vacíos y ".1", ".2" para repetidos
+    names = []
+    seen = {}
+    for i, v in enumerate(values):
+        name = f"Unnamed: {i}" if v is None or str(v).strip() == "" else v
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _cell(value):
+    # pandas.read_excel convierte 3.0 en 3; se hace lo mismo celda por celda
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def iter_documents_from_excel(excel_path, chunk_rows=2000):
+    # Lectura en streaming: openpyxl en modo read_only, de a chunk_rows filas por hoja.
+    # A diferencia de read_excel no hay inferencia de tipos por columna: en columnas
+    # numéricas con celdas vacías pandas escribía "3.0" y acá queda "3", y las fechas
+    # vacías no aparecen como "NaT". El manifiesto recalcula esas filas una sola vez.
+    from openpyxl import load_workbook
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = _header_names(header)
+            width = len(columns)
+            start = 0
+            chunk = []
+            for values in rows:
+                values = tuple(_cell(v) for v in values[:width])
+                chunk.append(values + (None,) * (width - len(values)))
+                if len(chunk) >= chunk_rows:
+                    df = pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)), dtype=object)
+                    yield from build_documents_from_frame(ws.title, df)
+                    start += len(chunk)
+                    chunk = []
+            if chunk:
+                df = pd.DataFrame(chunk, columns=columns, index=range(start, start + len(chunk)), dtype=object)
+                yield from build_documents_from_frame(ws.title, df)
+    finally:
+        wb.close()
+
+
+def build_documents_from_table(path):
+    # Un CSV o Parquet es una sola hoja; se llama como el archivo
+    sheet = os.path.splitext(os.path.basename(path))[0]
+    if path.lower().endswith(".parquet"):
+        try:
+            df = pd.read_parquet(path)
+        except ImportError as e:
+            raise ImportError(f"Para leer {path} hace falta pyarrow (pip install pyarrow)") from e
+    else:
+        # utf-8-sig: las exportaciones de Google Sheets y Excel a veces traen BOM
+        df = pd.read_csv(path, encoding="utf-8-sig")
+    return build_documents_from_frame(sheet, df)
+
+
+def iter_source(path, stream=False):
+    # Documentos de un archivo, con el archivo de origen en los metadatos
+    if path.lower().endswith(EXCEL_EXTENSIONS):
+        documents = iter_documents_from_excel(path) if stream else build_documents_from_excel(path)
+    else:
+        documents = build_documents_from_table(path)
+    for doc in documents:
+        doc["metadata"]["source"] = path
+        yield doc
+
+
+def read_source(path, stream=False):
+    return list(iter_source(path, stream))
+
+
+def _read_source_streaming(path):
+    return read_source(path, stream=True)
+
+
+def expand_sources(patterns):
+    # Globs ("escuelas/*.xlsx", "exports/**/*.csv"), carpetas o archivos sueltos;
+    # sin repetidos y en orden alfabético dentro de cada patrón
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*")
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            path = os.path.normpath(path)
+            if path.lower().endswith(SOURCE_EXTENSIONS) and not os.path.basename(path).startswith("~$"):
+                if path not in paths:
+                    paths.append(path)
+    return paths
+
+
+def iter_documents_from_sources(paths, workers=0, stream=False):
+    # Los archivos se parsean en paralelo; mientras el indexer calcula embeddings de los
+    # primeros, los demás se siguen leyendo. workers=0 usa un proceso por núcleo.
+    # Cada proceso devuelve su archivo entero, así que en memoria hay como mucho `workers`
+    # archivos a la vez: el siguiente se manda a leer recién cuando se consume uno.
+    if not paths:
+        return
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    if workers <= 1 or len(paths) == 1:
+        for path in paths:
+            yield from iter_source(path, stream=stream)
+        return
+    reader = _read_source_streaming if stream else read_source
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque((path, pool.submit(reader, path)) for path in paths[:workers])
+        queued = iter(paths[workers:])
+        while pending:
+            path, future = pending.popleft()
+            documents = future.result()
+            following = next(queued, None)
+            if following is not None:
+                pending.append((following, pool.submit(reader, following)))
+            print(f"  {path}: {len(documents)} documentos")
+            yield from documents
+            del documents